@@ -0,0 +1,42 @@
+"""Times each raster backend on a timetable PDF and reports per-page render time
+and peak RSS. Set `RASTER_BACKEND` in conf.py to the fastest one.
+
+    python bin/benchmark_backends.py [path/to/timetable.pdf] [--pages 1,3,5] [--backends pdfium,poppler]
+
+The timetable defaults to `conf.INPUT_TIMETABLE`.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from md_timetable_extract import benchmark
+from md_timetable_extract.lattice import RASTER_BACKENDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf_path', nargs='?', help="timetable to benchmark on (default: conf.INPUT_TIMETABLE)")
+    parser.add_argument('--pages', default='all', help="'all' (default) or page numbers like '1,3,5' or '2-4'")
+    parser.add_argument('--backends', default=','.join(RASTER_BACKENDS),
+                        help=f"comma separated (default: {','.join(RASTER_BACKENDS)})")
+    args = parser.parse_args()
+
+    pdf_path = args.pdf_path
+    if pdf_path is None:
+        import md_timetable_extract.conf as conf
+        pdf_path = conf.INPUT_TIMETABLE
+
+    backends = tuple(b.strip() for b in args.backends.split(',') if b.strip())
+    unknown = [b for b in backends if b not in RASTER_BACKENDS]
+    if unknown:
+        parser.error(f"unknown backends {unknown}, expected some of {RASTER_BACKENDS}")
+
+    print(f"Benchmarking {backends} on {pdf_path} (pages: {args.pages})")
+    results = benchmark.benchmark_backends(pdf_path, pages=args.pages, backends=backends)
+    print(benchmark.format_benchmarks(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import pandas as pd
 import octk
 
 from md_timetable_extract import extract, structs, process_timetable, post_processing
+from md_timetable_extract.event_table import EventTable
 import md_timetable_extract.conf as conf
 
 START_FROM_PAGE = 1
@@ -20,12 +21,11 @@ calendar_views: list[structs.CalendarWeekView] = (
         )
 )
 
-all_events = []
+events = EventTable()
 for calendar_view in calendar_views:
-    week_i_events:list[dict] = process_timetable.process_week_days(calendar_view.week, calendar_view.df)
-    all_events.extend(week_i_events)
+    process_timetable.process_week_days(calendar_view.week, calendar_view.df, calendar_view.event_slots, events)
 
-df = pd.DataFrame(all_events)
+df = events.to_frame()
 df = post_processing.post_process_events(df)
 
 
@@ -0,0 +1,130 @@
+# Description: Times how long each raster backend takes to render the pages of a
+# timetable, and how much memory it uses, so the fastest one can be pinned in conf.py.
+
+import ctypes
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import camelot
+
+from md_timetable_extract.lattice import RASTER_BACKENDS, PreparedPage
+from md_timetable_extract.pdf_source import open_source_document
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+@dataclass
+class PageRender:
+    page_number: int
+    seconds: float
+    peak_rss: int | None  # peak RSS of the benchmark process so far, in bytes
+
+
+@dataclass
+class BackendBenchmark:
+    backend: str
+    pages: list[PageRender] = field(default_factory=list)
+    error: str = None
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(p.seconds for p in self.pages)
+
+    @property
+    def peak_rss(self) -> int | None:
+        return max((p.peak_rss for p in self.pages if p.peak_rss is not None), default=None)
+
+
+def peak_rss() -> int | None:
+    """Peak resident set size of the current process in bytes, or None if unknown."""
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    if sys.platform == 'win32':
+        return _windows_peak_working_set()
+    return None
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'cb', 'PageFaultCount', 'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+        'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+        'PagefileUsage', 'PeakPagefileUsage',
+    )]
+
+
+def _windows_peak_working_set() -> int | None:
+    counters = _ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def benchmark_backend(pdf_path: str, backend: str, pages: list[int]) -> BackendBenchmark:
+    """Renders each page with `backend` (without falling back to another backend) and
+    records how long each render took. For backends that can only render files, that
+    includes writing the page out to its own file."""
+    open_source_document(pdf_path)  # opening the document isn't timed
+    benchmark = BackendBenchmark(backend)
+    for page in pages:
+        with PreparedPage(pdf_path, page, backend) as prepared_page:
+            start = time.perf_counter()
+            try:
+                prepared_page._render_page(use_fallback=False)
+            except Exception as e:
+                benchmark.error = " ".join(f"{type(e).__name__}: {e}".split())
+                return benchmark
+            seconds = time.perf_counter() - start
+        benchmark.pages.append(PageRender(page, seconds, peak_rss()))
+    return benchmark
+
+
+def benchmark_backends(pdf_path: str, pages='all', backends: tuple[str, ...] = RASTER_BACKENDS
+                       ) -> list[BackendBenchmark]:
+    """Benchmarks each backend on the given pages of `pdf_path`.
+
+    Each backend runs in a freshly spawned process, so its peak RSS isn't inflated by
+    the others (or by this one). Backends that aren't installed are reported with an error.
+    """
+    page_numbers = camelot.handlers.PDFHandler(pdf_path)._get_pages(pages)
+    benchmarks = []
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            benchmarks.append(executor.submit(benchmark_backend, pdf_path, backend, page_numbers).result())
+    return benchmarks
+
+
+def format_benchmarks(benchmarks: list[BackendBenchmark]) -> str:
+    """A per-page table of render times and peak RSS for each backend, then a summary
+    ranked by total render time."""
+    lines = []
+    for benchmark in benchmarks:
+        lines.append(f"{benchmark.backend}:")
+        if benchmark.error:
+            lines.append(f"  ! unavailable: {benchmark.error}")
+            continue
+        lines.append(f"  {'page':>5} {'render s':>9} {'peak RSS MB':>12}")
+        for p in benchmark.pages:
+            lines.append(f"  {p.page_number:>5} {p.seconds:>9.3f} {_megabytes(p.peak_rss):>12}")
+
+    lines.append("")
+    lines.append("Summary (fastest first):")
+    for benchmark in sorted((b for b in benchmarks if not b.error), key=lambda b: b.total_seconds):
+        n_pages = len(benchmark.pages)
+        mean = benchmark.total_seconds / n_pages if n_pages else 0.0
+        lines.append(f"  {benchmark.backend:<12} total {benchmark.total_seconds:7.2f}s"
+                     f"  mean {mean:6.3f}s/page  peak RSS {_megabytes(benchmark.peak_rss)} MB")
+    return "\n".join(lines)
+
+
+def _megabytes(n_bytes: int | None) -> str:
+    return "n/a" if n_bytes is None else f"{n_bytes / 2**20:.1f}"
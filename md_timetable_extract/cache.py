@@ -0,0 +1,96 @@
+# Description: On-disk cache of raw camelot extractions, keyed on page content
+# and extraction parameters, so unchanged pages are never re-extracted.
+
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from md_timetable_extract import fingerprint, structs
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class CachedTable:
+    """Stand-in for a `camelot.core.Table` restored from the cache.
+    Only has the attributes the extraction pipeline uses."""
+    df: pd.DataFrame
+    parsing_report: dict
+    spans: list[structs.CellSpan]
+
+
+class ExtractionCache:
+    """Content-addressed store of raw table extractions.
+
+    Entries are gzipped JSON files named after a hash of the page's content (see
+    `fingerprint.page_content_hash`) and the extraction parameters. Once the cache
+    grows past `max_bytes`, the least recently used entries are deleted.
+
+    Instances only hold the cache location, so they can be passed to worker processes.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def key(self, pdf_path: str, page: int | str, **params) -> str:
+        page_hash = fingerprint.page_content_hash(pdf_path, int(page))
+        params_str = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(f"{CACHE_FORMAT_VERSION}|{page_hash}|{params_str}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+
+    def get(self, key: str) -> CachedTable | None:
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # touch so eviction sees this entry as recently used
+        os.utime(path)
+        spans = [structs.CellSpan(text, [tuple(cell) for cell in cells]) for text, cells in entry['spans']]
+        return CachedTable(pd.DataFrame(entry['data'], dtype=object), entry['parsing_report'], spans)
+
+    def put(self, key: str, table) -> None:
+        """Stores anything with `df`, `parsing_report` and `spans` attributes, e.g. a
+        table from `lattice.PreparedPage`."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            'data': table.df.values.tolist(),
+            'parsing_report': {k: v for k, v in table.parsing_report.items() if k in ('accuracy', 'whitespace')},
+            'spans': [[span.text, span.cells] for span in table.spans],
+        }
+        # write then rename so concurrent workers never read a partial entry
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob('*/*.json.gz'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -4,7 +4,32 @@ from pathlib import Path
 # INPUT_TIMETABLE = r"content\input_pdfs\2025 IMED3112 Timetable STUDENTS v1.pdf"
 INPUT_TIMETABLE = r"path/to/Timetables/2026 IMS3 Timetable STUDENT v1.2.pdf"
 
-IGNORE_PAGES = [14,19,20]
+# pages that aren't week calendars are found automatically. To pick the pages to skip
+# by hand instead, list them here, e.g. [14,19,20]
+IGNORE_PAGES = None
+
+# raw table extractions are cached here, keyed on page content. Set to None to disable.
+EXTRACTION_CACHE_DIR = Path(".extraction_cache")
+# which line_scale worked for which page layout, so it can be tried first. Set to None to disable.
+LINE_SCALE_STATS_PATH = Path(".line_scale_stats.json")
+# fields worked out from each event description (subject, location, topic, ...), so
+# recurring events aren't post-processed again. Set to None to disable.
+DERIVED_FIELDS_CACHE_PATH = Path(".derived_fields_cache.json")
+# backend pages are rasterised with: "pdfium", "ghostscript" or "poppler".
+# Run `python bin/benchmark_backends.py` to see which is fastest on your machine.
+RASTER_BACKEND = "pdfium"
+# how table grids are found: "lattice" (from an image of the page, trying several line
+# scales) or "vector" (from the lines drawn in the PDF; much faster, falls back to
+# "lattice" on pages where it doesn't find a valid calendar table)
+TABLE_ENGINE = "lattice"
+# lattice pages: try every line scale at once in separate processes and keep the best
+# extraction, instead of trying them one after another. Faster per page with spare cores.
+SPECULATIVE_SCALES = False
+
+# incremental extraction: only pages that changed since this earlier version are re-extracted,
+# the rest are copied from its scraped output. Set both to None to extract everything.
+PREVIOUS_TIMETABLE = None  # e.g. r"path/to/Timetables/2026 IMS3 Timetable STUDENT v1.pdf"
+PREVIOUS_SCRAPED_OUTPUT = None  # e.g. r"path/to/Timetables/IMS3/Timetable STUDENT v1/2026 IMS3 Timetable STUDENT v1.csv"
 
 def parse_timetable_filename(timetable_path:Path) -> dict[str, str]:
     """Parse timetable filename to extract year and cohort information.
@@ -62,6 +87,9 @@ SCRAPED_TIMETABLE_OUTPUT_PATH = VERSION_OUTPUT_DIR / f"{timetable_name}.csv"
 # INPUT_XLSX = r'E:\OneDrive - UWA\MD1.2\2025 IMED3112 Timetable (my groups).xlsx'
 IMPORTABLE_CALENDAR_FILE = VERSION_OUTPUT_DIR / "importable_calendar.csv"
 
+# also write mandatory and non-mandatory calendars for every student group, at the paths below
+IMPORTABLE_GROUP_CALENDARS = False
+
 def importable_calendar_path_for_group(group_name: str, mandatory: bool) -> Path:
     suffix = "mandatory" if mandatory else "non_mandatory"
     return VERSION_OUTPUT_DIR / f"importable_calendar_{group_name}_{suffix}.csv"
\ No newline at end of file
@@ -0,0 +1,56 @@
+# Description: Event descriptions split into the parts post-processing reads from
+# them ([bracketed] and (parenthesised) segments, group ranges and the topic before
+# them) in a single scan.
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# Every '[' or '(' is a token. It captures its segment if it's closed, like
+# r'\[([^\]]+)\]' and r'\(([^)]+)\)' would from there. Group ranges ('Group 3',
+# 'Groups 1 - 10') are tokens too. The lookaheads make tokens zero-width, so segments
+# nested in other segments are still found.
+TOKEN_PATTERN = re.compile(
+    r'(?=\[([^\]]+)\])'
+    r'|(?=\(([^)]+)\))'
+    r'|(?=[\[(])'
+    r'|(?i:\bGroups?\s*(\d+(?:\s*-\s*\d+)?)\b)'
+)
+
+
+@dataclass(frozen=True)
+class ParsedDescription:
+    """The parts of an event description, in the order they appear in it. Segments
+    are the text between the brackets, unstripped."""
+    text: str
+    prefix: str  # everything before the first '(' or '['
+    bracketed: tuple[str, ...] = ()
+    parenthesised: tuple[str, ...] = ()
+    group_ranges: tuple[str, ...] = ()
+
+
+def normalise_whitespace(text: str) -> str:
+    """Collapses each run of whitespace (including newlines) into a single space."""
+    return WHITESPACE_PATTERN.sub(' ', text)
+
+
+@lru_cache(maxsize=8192)
+def parse_description(text: str) -> ParsedDescription:
+    """Splits a (whitespace normalised) description into its parts with one scan.
+    Cached, so every post-processing step reading the same description shares one parse."""
+    prefix_end = None
+    bracketed, parenthesised, group_ranges = [], [], []
+    for token in TOKEN_PATTERN.finditer(text):
+        in_brackets, in_parentheses, group_range = token.groups()
+        if group_range is not None:
+            group_ranges.append(group_range)
+            continue
+        if prefix_end is None:
+            prefix_end = token.start()
+        if in_brackets is not None:
+            bracketed.append(in_brackets)
+        elif in_parentheses is not None:
+            parenthesised.append(in_parentheses)
+    prefix = text if prefix_end is None else text[:prefix_end]
+    return ParsedDescription(text, prefix, tuple(bracketed), tuple(parenthesised), tuple(group_ranges))
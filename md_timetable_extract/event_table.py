@@ -0,0 +1,87 @@
+# Description: Events as they're built from week views, appended straight into
+# typed column buffers instead of one dict per event, then handed to pandas as a frame.
+
+from array import array
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# the columns of a scraped event, in order
+EVENT_COLUMNS = ['week', 'day', 'date', 'description', 'start_time', 'end_time', 'location', 'session_type', 'subject']
+# stands in for a missing start or end time in the time buffers
+NO_TIME = -1
+
+
+class EventTable:
+    """A fixed schema event accumulator.
+
+    Weeks and times (minutes since midnight, see `times`) go into `array` buffers,
+    which `to_frame` hands to pandas without copying. Dates, locations, session types
+    and subjects repeat a lot, so they're stored as codes into a dictionary of their
+    distinct values. Day and date text are made once for each distinct date.
+
+    Nothing can be appended once `to_frame` has been called while its frame is alive,
+    because the frame shares the buffers.
+    """
+    __slots__ = ('_weeks', '_dates', '_descriptions', '_start_times', '_end_times',
+                 '_locations', '_session_types', '_subjects')
+
+    def __init__(self):
+        self._weeks = array('q')
+        self._start_times = array('h')
+        self._end_times = array('h')
+        self._descriptions: list[str] = []
+        # value -> code dictionaries, and the codes of each event
+        self._dates: tuple[dict[datetime, int], array] = ({}, array('i'))
+        self._locations: tuple[dict[str, int], array] = ({}, array('i'))
+        self._session_types: tuple[dict[str, int], array] = ({}, array('i'))
+        self._subjects: tuple[dict[str, int], array] = ({}, array('i'))
+
+    def __len__(self) -> int:
+        return len(self._descriptions)
+
+    def append(self, week: int, date: datetime, description: str, start_time: int | None, end_time: int | None,
+               location: str = "", session_type: str = "", subject: str = ""):
+        self._weeks.append(week)
+        self._descriptions.append(description)
+        self._start_times.append(NO_TIME if start_time is None else start_time)
+        self._end_times.append(NO_TIME if end_time is None else end_time)
+        for (codes, column), value in ((self._dates, date), (self._locations, location),
+                                       (self._session_types, session_type), (self._subjects, subject)):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            column.append(code)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The events as a DataFrame with `EVENT_COLUMNS`. Start and end times are
+        nullable integer columns, with <NA> for missing times. Day, date, location,
+        session type and subject are categorical columns over the table's codes."""
+        dates = list(self._dates[0])
+        columns = {
+            'week': np.frombuffer(self._weeks, dtype=np.int64),
+            'day': _categorical([date.strftime("%A") for date in dates], self._dates[1]),
+            'date': _categorical([date.strftime("%Y-%m-%d") for date in dates], self._dates[1]),
+            'description': np.array(self._descriptions, dtype=object),
+            'start_time': _time_column(self._start_times),
+            'end_time': _time_column(self._end_times),
+            'location': _categorical(list(self._locations[0]), self._locations[1]),
+            'session_type': _categorical(list(self._session_types[0]), self._session_types[1]),
+            'subject': _categorical(list(self._subjects[0]), self._subjects[1]),
+        }
+        return pd.DataFrame(columns, columns=EVENT_COLUMNS, copy=False)
+
+
+def _categorical(values: list[str], codes: array) -> pd.Categorical:
+    codes = np.frombuffer(codes, dtype=np.int32)
+    value_codes, categories = pd.factorize(pd.Series(values, dtype=object))
+    if len(categories) < len(values):
+        # e.g. day names, which repeat across dates
+        codes = value_codes[codes]
+    return pd.Categorical.from_codes(codes, categories)
+
+
+def _time_column(minutes: array) -> pd.arrays.IntegerArray:
+    values = np.frombuffer(minutes, dtype=np.int16)
+    return pd.arrays.IntegerArray(values, values == NO_TIME)
@@ -2,37 +2,39 @@
 # week-long calendar layouts. i.e. Days as columns, & time slots as rows.
 
 import camelot
+import contextlib
+import io
+import multiprocessing
+import os
+import numpy as np
 import pandas as pd
-from md_timetable_extract import structs
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator
+from md_timetable_extract import fingerprint, structs, triage
+from md_timetable_extract.cache import ExtractionCache
+from md_timetable_extract.lattice import DEFAULT_RASTER_BACKEND, LATTICE_ENGINE, VECTOR_ENGINE, PreparedPage
+from md_timetable_extract.scale_stats import LineScaleStats
+from md_timetable_extract.structs import is_valid_time_value
+from md_timetable_extract.times import parse_time
 import re
 
 
 pd.options.mode.chained_assignment = None
 
-def is_key_table(table: camelot.core.Table) -> bool:
-    return table.df.iloc[0, 0].strip().lower() == 'key'
+# temporary week view column tracking which scraped table row each row came from
+SOURCE_ROW_COLUMN = '__source_row'
 
-def is_valid_time_value(time_str: str) -> bool:
-    """Check if a string is a valid time value in HH:MM format.
-    Valid examples: '09:00', '14:30', '8', '08', '12', '23:59', '8.00', '08.00'
-    """
-    isValid = True
-    pattern = r'^\d{1,2}([:\.]\d{2})?$'
-    if re.match(pattern, time_str):
-        if ':' in time_str:
-            hours, minutes = map(int, time_str.split(':'))
-            if 0 <= hours < 24 and 0 <= minutes < 60:
-                return True
-        elif '.' in time_str:
-            hours, minutes = map(int, time_str.split('.'))
-            if 0 <= hours < 24 and 0 <= minutes < 60:
-                return True
-        else:
-            hours = int(time_str)
-            if 0 <= hours < 24:
-                return True
-    return False
+LINE_SCALES_TO_TRY = [60, 40, 80, 100]
+# a valid extraction with at least this camelot accuracy is taken without waiting for other scales
+CLEAR_WIN_ACCURACY = 95.0
+# the pattern `is_valid_time_value` accepts, capturing hours and minutes
+TIME_VALUE_PATTERN = r'^(\d{1,2})(?:[:\.](\d{2}))?$'
+# 'HH:MM' label of each half-hour slot of the day, indexed by minutes // 30
+HALF_HOUR_LABELS = np.array([f"{m // 60:02}:{m % 60:02}" for m in range(0, 24 * 60, 30)], dtype=object)
 
+def is_key_table(table: camelot.core.Table) -> bool:
+    return table.df.iloc[0, 0].strip().lower() == 'key'
 
 def standardize_time_format(time_str: str) -> str:
     """Convert time string to HH:MM format.
@@ -52,15 +54,22 @@ def standardize_time_format(time_str: str) -> str:
     return f"{hours:02}:{minutes:02}"
 
 
+def time_column_minutes(times: pd.Series) -> np.ndarray:
+    """Minutes since midnight of each time in `times` (see `is_valid_time_value`).
+    Raises ValueError for the first invalid one."""
+    times = times.str.strip()
+    parts = times.str.extract(TIME_VALUE_PATTERN)
+    hours = pd.to_numeric(parts[0])
+    minutes = pd.to_numeric(parts[1]).fillna(0)
+    invalid = hours.isna() | (hours >= 24) | (minutes >= 60)
+    if invalid.any():
+        raise ValueError(f"Invalid time value found: {times[invalid].iloc[0]}")
+    return (hours * 60 + minutes).to_numpy(dtype=int)
+
+
 def standardize_time_column(df: pd.DataFrame, time_col_name: str = 'Time') -> pd.DataFrame:
     """Standardize the time column in the dataframe to HH:MM format."""
-    for i, row in df.iterrows():
-        time_str = row[time_col_name].strip()
-        if is_valid_time_value(time_str):
-            standardized_time = standardize_time_format(time_str)
-            df.at[i, time_col_name] = standardized_time
-        else:
-            raise ValueError(f"Invalid time value found: {time_str}")
+    df[time_col_name] = [f"{m // 60:02}:{m % 60:02}" for m in time_column_minutes(df[time_col_name])]
     return df
 
 
@@ -94,68 +103,355 @@ def standardize_time_column(df: pd.DataFrame, time_col_name: str = 'Time') -> pd
 
 
 # entry point
-def get_weekly_calendar_views(pdf_path: str, ignore_pages:list[int], start_page:int = 1, pages='all'
+def get_weekly_calendar_views(pdf_path: str, ignore_pages:list[int] = None, start_page:int = 1, pages='all',
+                                workers:int = 1, speculative_scales:bool = False,
+                                cache:ExtractionCache = None, scale_stats:LineScaleStats = None,
+                                backend:str = DEFAULT_RASTER_BACKEND, engine:str = LATTICE_ENGINE
                                 ) -> list[structs.CalendarWeekView]:
     """Extracts weekly calendar views from a timetable PDF.
+    See `iter_weekly_calendar_views` for the arguments."""
+    return list(iter_weekly_calendar_views(pdf_path, ignore_pages=ignore_pages, start_page=start_page, pages=pages,
+                                           workers=workers, speculative_scales=speculative_scales, cache=cache,
+                                           scale_stats=scale_stats, backend=backend, engine=engine))
+
+
+def iter_weekly_calendar_views(pdf_path: str, ignore_pages:list[int] = None, start_page:int = 1, pages='all',
+                               workers:int = 1, speculative_scales:bool = False,
+                               cache:ExtractionCache = None, scale_stats:LineScaleStats = None,
+                               backend:str = DEFAULT_RASTER_BACKEND, engine:str = LATTICE_ENGINE
+                               ) -> Iterator[structs.CalendarWeekView]:
+    """Extracts weekly calendar views from a timetable PDF, yielding each week as soon
+    as its page (and every page before it) is done.
     
-    Any pages before `start_page` or in `ignore_pages` are skipped
+    Any pages before `start_page` or in `ignore_pages` are skipped. If `ignore_pages`
+    is None, pages are triaged from their text instead (see `triage.classify_page_text`)
+    and anything that isn't a week calendar page is skipped.
+
+    If `workers` is greater than 1, pages are extracted in a pool of that many
+    processes. Results (and each page's diagnostics) are still yielded in page order.
+
+    If `speculative_scales` is True, all line scales for a page are tried at once
+    and the best scoring extraction is kept (see `extract_scraped_week_speculatively`).
+    The attempts share the machine's cores with the other page workers.
+
+    If a `cache` is given, raw camelot extractions are read from and saved to it.
+
+    If `scale_stats` are given, each page tries the line scales that have worked for
+    its layout first, and the outcome is recorded (and saved) for later pages and runs.
+    In parallel mode, pages only benefit from what was recorded before the run.
+
+    `backend` is the image conversion backend pages are rasterised with (see
+    `lattice.RASTER_BACKENDS`, and `bin/benchmark_backends.py` to pick one).
+
+    With `engine='vector'`, table grids are read from the ruling lines the PDF draws
+    rather than from an image of the page (see `extract_scraped_week_from_rulings`).
 
     """
     # TODO: add GUI to select line_scale
 
-    invalid_extractions = {
-        # page number - scale tried: df
-    }
-    
     handler = camelot.handlers.PDFHandler(pdf_path)
     page_numbers = handler._get_pages(pages)
     page_numbers = [p for p in page_numbers if int(p) >= start_page]
-    page_numbers = [p for p in page_numbers if p not in ignore_pages]
+    if ignore_pages is None:
+        page_numbers = triaged_calendar_pages(pdf_path, page_numbers)
+    else:
+        page_numbers = [p for p in page_numbers if p not in ignore_pages]
     print(f"Processing pages: {page_numbers}")
 
-    weekly_calendar_views = []
-    for i, page in enumerate(page_numbers):
-        extraction_successful = False
-        scales_to_try = [60, 40, 80, 100]
-        while not extraction_successful and scales_to_try:
-            line_scale = scales_to_try.pop(0)
+    page_workers = min(workers, len(page_numbers)) if workers > 1 and len(page_numbers) > 1 else 1
+    extract_page = partial(extract_week_from_page, pdf_path, speculative_scales=speculative_scales, cache=cache,
+                           scale_stats=scale_stats, backend=backend, engine=engine,
+                           attempt_processes=max(1, (os.cpu_count() or 1) // page_workers))
+    with contextlib.ExitStack() as stack:
+        if page_workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=page_workers))
+            # results come back in page order, as soon as each is done
+            results = executor.map(extract_page, page_numbers)
+        else:
+            # lazily, so each page's scale order includes what earlier pages recorded
+            results = map(extract_page, page_numbers)
+        yield from _report_page_results(results, scale_stats)
+
+
+def _report_page_results(results: Iterable[structs.PageExtractionResult],
+                         scale_stats: LineScaleStats = None) -> Iterator[structs.CalendarWeekView]:
+    """Prints each page's diagnostics, records its line scale outcomes and yields its week view."""
+    failed_pages = []
+    for result in results:
+        print(result.log, end='')
+        if scale_stats is not None and result.layout is not None:
+            for line_scale in result.invalid_scales:
+                scale_stats.record(result.layout, line_scale, success=False)
+            if result.line_scale is not None:
+                scale_stats.record(result.layout, result.line_scale, success=True)
+        if result.week_view is None:
+            failed_pages.append(result.page_number)
+            continue
+        yield result.week_view
+
+    if failed_pages:
+        print(f"! Pages without a calendar view: {failed_pages}")
+    if scale_stats is not None:
+        scale_stats.save()
+
+
+def triaged_calendar_pages(pdf_path: str, page_numbers: list[int]) -> list[int]:
+    """Returns the pages of `page_numbers` that triage as week calendar pages."""
+    calendar_pages = []
+    for page_triage in triage.triage_pages(pdf_path, page_numbers):
+        if page_triage.is_calendar:
+            calendar_pages.append(page_triage.page_number)
+        else:
+            print(f"  - Skipping page {page_triage.page_number} ({page_triage.kind} page)")
+    return calendar_pages
+
+
+def extract_week_from_page(pdf_path: str, page: int, line_scales: list[int] = None, speculative_scales: bool = False,
+                           cache: ExtractionCache = None, backend: str = DEFAULT_RASTER_BACKEND,
+                           engine: str = LATTICE_ENGINE, attempt_processes: int = None,
+                           scale_stats: LineScaleStats = None) -> structs.PageExtractionResult:
+    """Runs the page -> `ScrapedWeekRaw` -> `standardise_week_view` chain for one page,
+    trying `line_scales` (default `LINE_SCALES_TO_TRY`) in order, or at once in up to
+    `attempt_processes` processes with `speculative_scales`.
+
+    With `scale_stats`, the page's layout is fingerprinted and the scales that have
+    worked for it are tried first. Recording the outcome is left to the caller.
+
+    Anything printed along the way is captured in the result's `log`, so pages
+    extracted in parallel don't interleave their diagnostics.
+    """
+    result = structs.PageExtractionResult(page)
+    line_scales = line_scales or LINE_SCALES_TO_TRY
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        try:
+            if scale_stats is not None:
+                result.layout = fingerprint.layout_fingerprint(pdf_path, page)
+                line_scales = scale_stats.ordered_scales(result.layout, line_scales)
+            _extract_week_from_page(pdf_path, page, result, line_scales, speculative_scales, cache, backend, engine,
+                                    attempt_processes)
+        except Exception as e:
+            result.error = str(e)
+            print(f"  ! Error processing page {page}: {e}")
+    result.log = log.getvalue()
+    return result
+
+
+def _extract_week_from_page(pdf_path: str, page: int, result: structs.PageExtractionResult,
+                            line_scales: list[int], speculative_scales: bool, cache: ExtractionCache, backend: str,
+                            engine: str, attempt_processes: int = None):
+    scraped_week_raw = None
+    if engine == VECTOR_ENGINE:
+        scraped_week_raw = extract_scraped_week_from_rulings(pdf_path, page, cache)
+    if scraped_week_raw is None and speculative_scales:
+        scraped_week_raw = extract_scraped_week_speculatively(pdf_path, page, result, cache, line_scales, backend,
+                                                              attempt_processes)
+    elif scraped_week_raw is None:
+        scraped_week_raw = extract_scraped_week(pdf_path, page, result, cache, line_scales, backend)
+
+    if scraped_week_raw is None:
+        result.error = f"no valid calendar table after trying line scales {result.invalid_scales}"
+        print(f"  ! Failed to extract valid calendar table on page {page} after trying multiple line scales")
+        return
+
+    week_number = structs.get_week_number(scraped_week_raw.df)
+    try:
+        interpolated_df, source_rows = _standardise_week_view(scraped_week_raw)
+    except Exception as e:
+        result.error = f"error processing week {week_number}: {e}"
+        print(f"Error processing week {week_number}: {e}")
+        return
+    event_slots = get_event_slots(scraped_week_raw, interpolated_df, source_rows)
+    result.week_view = structs.CalendarWeekView(int(week_number), interpolated_df, event_slots)
+
+
+def extract_scraped_week(pdf_path: str, page: int, result: structs.PageExtractionResult,
+                         cache: ExtractionCache = None, line_scales: list[int] = LINE_SCALES_TO_TRY,
+                         backend: str = DEFAULT_RASTER_BACKEND) -> structs.ScrapedWeekRaw | None:
+    """Tries each line scale in turn and returns the first valid extraction, or None.
+    The page is only laid out and rendered once, however many scales are tried."""
+    with PreparedPage(pdf_path, page, backend) as prepared_page:
+        for line_scale in line_scales:
             print(f"  - Processing page {page} with line_scale={line_scale}")
-            calendar_df: pd.DataFrame = extract_calendar_page_view_as_df(pdf_path, page=str(page), line_scale=line_scale)
+            calendar_table = extract_calendar_page_table(
+                pdf_path, page=str(page), line_scale=line_scale, cache=cache, prepared_page=prepared_page)
 
-            scraped_week_raw = structs.ScrapedWeekRaw.from_df(page, calendar_df)
+            scraped_week_raw = structs.ScrapedWeekRaw.from_df(page, calendar_table.df, calendar_table.spans)
             if scraped_week_raw.is_valid:
                 print(f"    - Found valid calendar table on page {page} with line_scale={line_scale}")
-                extraction_successful = True
-            else:
-                invalid_extractions[f"p{page}-scale {line_scale}"] = scraped_week_raw.df
-                print(f"    ! No valid calendar tables found on page {page} with line_scale={line_scale}")
-                line_scale += 20
-        
-        if not extraction_successful:
-            print(f"  ! Failed to extract valid calendar table on page {page} after trying multiple line scales")
-            continue
+                result.line_scale = line_scale
+                return scraped_week_raw
+            result.invalid_scales.append(line_scale)
+            print(f"    ! No valid calendar tables found on page {page} with line_scale={line_scale}")
+    return None
+
+
+def extract_scraped_week_from_rulings(pdf_path: str, page: int, cache: ExtractionCache = None
+                                      ) -> structs.ScrapedWeekRaw | None:
+    """Extracts the page's table from the ruling lines drawn in the PDF, and returns
+    it if it is valid, or None (e.g. if the grid is part of an image)."""
+    print(f"  - Processing page {page} with its ruling lines")
+    with PreparedPage(pdf_path, page) as prepared_page:
+        try:
+            calendar_table = extract_calendar_page_table(pdf_path, str(page), None, cache, prepared_page,
+                                                         engine=VECTOR_ENGINE)
+        except ValueError as e:
+            print(f"    ! {e}")
+            return None
+    scraped_week_raw = structs.ScrapedWeekRaw.from_df(page, calendar_table.df, calendar_table.spans)
+    if not scraped_week_raw.is_valid:
+        print(f"    ! No valid calendar table found from the ruling lines on page {page}, trying line scales")
+        return None
+    print(f"    - Found valid calendar table on page {page} from its ruling lines")
+    return scraped_week_raw
+
+
+def extract_scraped_week_speculatively(pdf_path: str, page: int, result: structs.PageExtractionResult,
+                                       cache: ExtractionCache = None, line_scales: list[int] = LINE_SCALES_TO_TRY,
+                                       backend: str = DEFAULT_RASTER_BACKEND, processes: int = None
+                                       ) -> structs.ScrapedWeekRaw | None:
+    """Tries all line scales concurrently and returns the best valid extraction, or None.
+
+    Scales with an extraction in the `cache` are scored first, and if any of them is
+    valid the best one is used straight away, without rendering the page.
+
+    Otherwise the page is prepared (laid out, rendered and thresholded) once, here,
+    then sent to a pool of up to `processes` processes (default: one per scale) that
+    each parse it with one of the remaining scales. With a single process, the scales
+    are parsed in turn here instead, without starting a pool. Attempts are ranked by
+    `ScaleAttempt.score`. As soon as one is a clear win (valid, with accuracy of at
+    least `CLEAR_WIN_ACCURACY`) the remaining attempts are stopped, including ones
+    already running.
+    """
+    print(f"  - Processing page {page} with line_scales={line_scales}")
+    scales = list(enumerate(line_scales))
+    cached_attempts = _cached_line_scale_attempts(pdf_path, page, scales, cache, backend)
+    best = _best_line_scale_attempt(cached_attempts, result)
+    if best is None or not best.is_valid:
+        cached_scales = {attempt.line_scale for attempt in cached_attempts}
+        uncached = [(priority, line_scale) for priority, line_scale in scales if line_scale not in cached_scales]
+        # closing stops the pool as soon as the best attempt has been picked
+        with contextlib.closing(_line_scale_attempts(pdf_path, page, uncached, cache, backend, processes)) as attempts:
+            best = _best_line_scale_attempt(attempts, result, best)
+
+    if best is None or not best.is_valid:
+        return None
+    print(f"    - Using line_scale={best.line_scale} for page {page} "
+          f"(accuracy={best.accuracy}, whitespace={best.whitespace})")
+    result.line_scale = best.line_scale
+    return best.scraped_week_raw
+
+
+def _best_line_scale_attempt(attempts: Iterable[structs.ScaleAttempt], result: structs.PageExtractionResult,
+                             best: structs.ScaleAttempt = None) -> structs.ScaleAttempt | None:
+    for attempt in attempts:
+        print(attempt.log, end='')
+        if not attempt.is_valid:
+            result.invalid_scales.append(attempt.line_scale)
+        if best is None or attempt.score > best.score:
+            best = attempt
+        if attempt.is_valid and attempt.accuracy >= CLEAR_WIN_ACCURACY:
+            break
+    return best
 
-        week_number = structs.get_week_number(scraped_week_raw.df)
+
+def _cached_line_scale_attempts(pdf_path: str, page: int, scales: list[tuple[int, int]], cache: ExtractionCache,
+                                backend: str) -> list[structs.ScaleAttempt]:
+    if cache is None:
+        return []
+    attempts = []
+    for priority, line_scale in scales:
+        table = cache.get(table_cache_key(cache, pdf_path, page, line_scale, backend))
+        if table is None:
+            continue
+        attempt = structs.ScaleAttempt(line_scale, priority)
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            score_line_scale_attempt(attempt, page, table)
+        attempt.log = log.getvalue()
+        attempts.append(attempt)
+    return attempts
+
+
+def _line_scale_attempts(pdf_path: str, page: int, scales: list[tuple[int, int]], cache: ExtractionCache,
+                         backend: str, processes: int = None) -> Iterator[structs.ScaleAttempt]:
+    """Yields the attempts for `scales` as they finish. Closing the generator stops
+    any attempts still running."""
+    if not scales:
+        return
+    with PreparedPage(pdf_path, page, backend) as prepared_page:
+        prepared_page.prepare()
+        tasks = [(prepared_page, line_scale, priority, cache) for priority, line_scale in scales]
+        processes = min(processes or len(tasks), len(tasks))
+        if processes <= 1:
+            yield from map(_attempt_line_scale_task, tasks)
+            return
+        # leaving the pool terminates any attempts still running, before the page is closed
+        with multiprocessing.Pool(processes=processes) as pool:
+            yield from pool.imap_unordered(_attempt_line_scale_task, tasks)
+
+
+def _attempt_line_scale_task(args: tuple) -> structs.ScaleAttempt:
+    return attempt_line_scale(*args)
+
+
+def attempt_line_scale(prepared_page: PreparedPage, line_scale: int, priority: int = 0,
+                       cache: ExtractionCache = None) -> structs.ScaleAttempt:
+    """Extracts and validates a prepared page with one line scale, capturing its diagnostics."""
+    page = prepared_page.page
+    attempt = structs.ScaleAttempt(line_scale, priority)
+    with contextlib.redirect_stdout(io.StringIO()) as log:
         try:
-            interpolated_df = standardise_week_view(scraped_week_raw)
+            table = extract_calendar_page_table(prepared_page.pdf_path, str(page), line_scale, cache, prepared_page)
         except Exception as e:
-            print(f"Error processing week {week_number}: {e}")
-            continue
-        weekly_calendar_views.append(structs.CalendarWeekView(int(week_number), interpolated_df))
-
-    return weekly_calendar_views
+            print(f"    ! Error on page {page} with line_scale={line_scale}: {e}")
+        else:
+            score_line_scale_attempt(attempt, page, table)
+    attempt.log = log.getvalue()
+    return attempt
+
+
+def score_line_scale_attempt(attempt: structs.ScaleAttempt, page: int, table) -> None:
+    """Fills in `attempt` from an extracted (or cached) table."""
+    attempt.scraped_week_raw = structs.ScrapedWeekRaw.from_df(page, table.df, table.spans)
+    attempt.accuracy = table.parsing_report['accuracy']
+    attempt.whitespace = table.parsing_report['whitespace']
+    if attempt.is_valid:
+        print(f"    - Found valid calendar table on page {page} with line_scale={attempt.line_scale}")
+    else:
+        print(f"    ! No valid calendar tables found on page {page} with line_scale={attempt.line_scale}")
 
 
-def extract_calendar_page_view_as_df(pdf_path: str, page:str, line_scale) -> pd.DataFrame:
+def extract_calendar_page_view_as_df(pdf_path: str, page:str, line_scale, cache: ExtractionCache = None,
+                                     prepared_page: PreparedPage = None, engine: str = LATTICE_ENGINE
+                                     ) -> pd.DataFrame:
     """Extracts a single page calendar view from a PDF and returns it as a DataFrame
     *without* rearranging cells.
-    Assumes exactly one calendar table per page, and ignores any 'Key' tables."""
-    tables = camelot.read_pdf(
-        pdf_path, flavor='lattice', 
-        line_scale=line_scale, 
-        copy_text=['v', 'h'], 
-        pages=page
-        )
+    Assumes exactly one calendar table per page, and ignores any 'Key' tables.
+    With `engine='vector'` the grid comes from the PDF's ruling lines and `line_scale` is ignored."""
+    return extract_calendar_page_table(pdf_path, page, line_scale, cache, prepared_page, engine=engine).df
+
+
+def extract_calendar_page_table(pdf_path: str, page:str, line_scale, cache: ExtractionCache = None,
+                                prepared_page: PreparedPage = None, backend: str = DEFAULT_RASTER_BACKEND,
+                                engine: str = LATTICE_ENGINE) -> camelot.core.Table:
+    """Same as `extract_calendar_page_view_as_df`, but returns the camelot table
+    so its parsing report and merged cells (`spans`) are available.
+    If a `cache` is given, a cached extraction of identical page content is returned
+    instead (as a `cache.CachedTable`) when there is one.
+    Pass a `prepared_page` to reuse its layout and rendered image across calls
+    (its backend is then used instead of `backend`)."""
+    if prepared_page is not None:
+        backend = prepared_page.backend
+    if cache is not None:
+        cache_key = table_cache_key(cache, pdf_path, page, line_scale, backend, engine)
+        cached_table = cache.get(cache_key)
+        if cached_table is not None:
+            return cached_table
+
+    if prepared_page is None:
+        with PreparedPage(pdf_path, int(page), backend) as prepared_page:
+            tables = _extract_page_tables(prepared_page, engine, line_scale)
+    else:
+        tables = _extract_page_tables(prepared_page, engine, line_scale)
     if len(tables) == 0:
         raise ValueError(f"No tables found on page {page}")
     
@@ -167,90 +463,116 @@ def extract_calendar_page_view_as_df(pdf_path: str, page:str, line_scale) -> pd.
             else:
                 calendar_index = i
                 break
-    calendar_df = tables[calendar_index].df
-    return calendar_df
+    calendar_table = tables[calendar_index]
+    if cache is not None:
+        cache.put(cache_key, calendar_table)
+    return calendar_table
+
 
+def table_cache_key(cache: ExtractionCache, pdf_path: str, page: int | str, line_scale: int, backend: str,
+                    engine: str = LATTICE_ENGINE) -> str:
+    """The `cache` key for a page's table extracted with these settings."""
+    if engine == VECTOR_ENGINE:
+        # nothing is rendered, so these make no difference
+        return cache.key(pdf_path, page, flavor=engine)
+    return cache.key(pdf_path, page, flavor=engine, line_scale=line_scale, backend=backend)
 
-def update_minute_time_slot(time_str: str, new_minute: int) -> str:
-    """Update the minute part of a time string in HH:MM format."""
-    hours, _ = time_str.split(":")
-    return f"{hours}:{new_minute:02}"
+
+def _extract_page_tables(prepared_page: PreparedPage, engine: str, line_scale: int) -> list[camelot.core.Table]:
+    if engine == VECTOR_ENGINE:
+        return prepared_page.extract_vector_tables()
+    return prepared_page.extract_tables(line_scale)
 
 
 def standardise_week_view(scraped_week_table: structs.ScrapedWeekRaw) -> pd.DataFrame:
     """Interpolate a week view dataframe to ensure all time slots are present"""
+    return _standardise_week_view(scraped_week_table)[0]
+
+
+def _standardise_week_view(scraped_week_table: structs.ScrapedWeekRaw) -> tuple[pd.DataFrame, list[int]]:
+    """`standardise_week_view`, also returning the row of the scraped table each
+    row of the week view came from."""
+    layout = scraped_week_table.layout
     base_df = scraped_week_table.df.copy()
 
+    if layout.header_row == -1:
+        raise ValueError("Could not find the header row in timetable.")
+    # Create a new dataframe with standardized column names ('Time', dates, renamed duplicates) and time slots
+    base_df.columns = week_view_columns(base_df.iloc[layout.header_row].tolist(), layout)
+    base_df[SOURCE_ROW_COLUMN] = range(len(base_df))
 
-    # Create a new dataframe with standardized column names and time slots
-    # Copy column names 
-    columns = base_df.iloc[scraped_week_table.date_row_index]
-    # Make first column should 'Time'
-    columns.iloc[0] = 'Time'
-    # rename duplicate columns
-    columns = [f'{col} ({i})' if columns.duplicated().iloc[i] else col for i, col in enumerate(columns)]
-    
-    base_df.columns = columns
-    
-    # get rows where time contains 'online'
-    try:
-        online_rows = base_df[base_df['Time'].str.contains('online', case=False)]
-    except Exception as e:
-        raise Exception(f"Error occurred while extracting online rows: {e}")
+    online_rows = base_df.iloc[layout.online_rows]
 
-    # find first row with number in the time column
-    is_start_found = False
-    for i, row in base_df.iterrows():
-        if is_valid_time_value(row.iloc[0]):
-            is_start_found = True
-            break
-    if not is_start_found:
+    if layout.first_time_row == -1:
         raise ValueError("Could not find start of time slots in timetable.")
-    time_start_row = i
-
-    # make new table starting from time_start_row (i.e. drop earlier rows, then add online rows later)
-    class_time_week_view_df = base_df.iloc[time_start_row:]
-    class_time_week_view_df.reset_index(drop=True, inplace=True)
-
-    class_time_week_view_df = standardize_time_column(class_time_week_view_df, time_col_name='Time')
-
-    # Find and save the indices of all rows which represent the start of a half-hour slot
-    half_past_rows = []
-    max_index = len(class_time_week_view_df) - 1
-    for i, row in class_time_week_view_df.iterrows():
-        start_time = class_time_week_view_df.loc[i, 'Time'].strip()
-        if start_time.isdigit() and len(start_time) < 2:
-            class_time_week_view_df.loc[i, 'Time'] = '0' + start_time
-        if i+1 == max_index:
-            break
-        if  start_time == class_time_week_view_df.loc[i+1, 'Time']:
-            # there is a duplicated time 
-            # we assume this to be the start of a half-hour slot 
-            half_past_rows.append(i+1)
-
-    # Scan the timetable. 
-    # If the timeslot is in the half_past_rows list, add ':30' to the time
-    # Else, add ':00' to the time
-    # Also, create half-hour slots that don't already exist
-    new_half_past_rows = []
-    for i, row in class_time_week_view_df.iterrows():
-        if i in half_past_rows:
-            class_time_week_view_df.loc[i, 'Time'] = update_minute_time_slot(class_time_week_view_df.loc[i, 'Time'], 30)
-        elif i+1 in half_past_rows:
-            class_time_week_view_df.loc[i, 'Time'] = update_minute_time_slot(class_time_week_view_df.loc[i, 'Time'], 0)
-        else:
-            new_half_past_rows.append(class_time_week_view_df.iloc[i].to_dict())
-            class_time_week_view_df.loc[i, 'Time'] = update_minute_time_slot(class_time_week_view_df.loc[i, 'Time'], 0)
+    time_start_row = layout.first_time_row
+
+    # the time rows, from time_start_row on (earlier rows are dropped, online rows are added back later)
+    time_rows = base_df.iloc[time_start_row:]
+    minutes = time_column_minutes(time_rows['Time'])
+    hours = minutes // 60
+
+    # A time repeated in the next row is taken to be the start of a half-hour slot.
+    # (The last pair of rows is never compared.)
+    n_rows = len(time_rows)
+    is_half_past = np.zeros(n_rows, dtype=bool)
+    if n_rows > 2:
+        is_half_past[1:-1] = minutes[:-2] == minutes[1:-1]
+    # Half past rows take the half hour and the rows before them the hour. Any other row
+    # spans both, so it's repeated for the half hour slot it's missing.
+    is_before_half_past = np.append(is_half_past[1:], False)
+    missing_half_past = np.flatnonzero(~is_half_past & ~is_before_half_past)
+
+    # the full half-hour grid, as positions in time_rows and the slot each fills, in time order
+    grid_rows = np.concatenate([np.arange(n_rows), missing_half_past])
+    grid_slots = np.concatenate([hours * 2 + is_half_past, hours[missing_half_past] * 2 + 1])
+    order = np.argsort(grid_slots, kind='stable')
+    in_person_rows = time_rows.iloc[grid_rows[order]]
+    in_person_rows['Time'] = HALF_HOUR_LABELS[grid_slots[order]]
+    full_df = pd.concat([in_person_rows, online_rows], ignore_index=True)
+    source_rows = full_df.pop(SOURCE_ROW_COLUMN).tolist()
 
-    for d in new_half_past_rows:
-        d['Time'] = update_minute_time_slot(d['Time'], 30)
+    return full_df, source_rows
 
-    new_rows_df = pd.DataFrame(new_half_past_rows)
 
-    # Combine existing rows with new half-hour slots
-    in_person_rows = pd.concat([class_time_week_view_df, new_rows_df], ignore_index=True)
-    # sort by time
-    in_person_rows = in_person_rows.sort_values(by='Time')
-    full_df = pd.concat([in_person_rows, online_rows], ignore_index=True)
-    
-    return full_df
+def week_view_columns(headers: list[str], layout: structs.WeekLayout) -> list[str]:
+    """The week view's column names: 'Time', then the header row's dates, with each
+    duplicated header (see `WeekLayout.duplicate_columns`) suffixed ' (<column>)'."""
+    columns = list(headers)
+    columns[layout.time_column] = 'Time'
+    for column in layout.duplicate_columns:
+        columns[column] = f'{columns[column]} ({column})'
+    return columns
+
+
+def get_event_slots(scraped_week_table: structs.ScrapedWeekRaw, week_view_df: pd.DataFrame,
+                    source_rows: list[int]) -> list[structs.EventSlot] | None:
+    """Places each merged cell of the scraped table in the standardised week view.
+
+    An event starts at the first week view row its cell covers and ends at the last,
+    in each date column it covers. Slots are ordered by column, then by first row.
+    Returns None if the scraped table has no span information.
+    """
+    if scraped_week_table.spans is None:
+        return None
+    view_rows_of: dict[int, list[int]] = {}
+    for view_row, source_row in enumerate(source_rows):
+        view_rows_of.setdefault(source_row, []).append(view_row)
+
+    columns = list(week_view_df.columns)
+    times = [parse_time(label) for label in week_view_df['Time'].tolist()]
+    column_slots: dict[int, list[tuple[int, int, str]]] = {col: [] for col in range(1, len(columns))}
+    for span in scraped_week_table.spans:
+        span_rows: dict[int, list[int]] = {}
+        for row, col in span.cells:
+            if col in column_slots:
+                span_rows.setdefault(col, []).extend(view_rows_of.get(row, []))
+        for col, view_rows in span_rows.items():
+            if view_rows:
+                column_slots[col].append((min(view_rows), max(view_rows), span.text))
+
+    return [
+        structs.EventSlot(columns[col], text, times[first], times[last])
+        for col, slots in column_slots.items()
+        for first, last, text in sorted(slots)
+    ]
@@ -0,0 +1,72 @@
+# Description: Remember the fields post-processing derives from each distinct event
+# description, so recurring events (in a timetable and across its versions) are only
+# worked out once.
+
+import json
+from collections import OrderedDict
+from pathlib import Path
+
+# bump when the way post_processing derives fields changes, so old entries are dropped
+FIELD_CACHE_FORMAT_VERSION = 1
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+class DerivedFieldsCache:
+    """Least recently used map from an event's (description, location, session_type,
+    subject), as built from the timetable, to the fields post-processing derives from
+    them (see `post_processing.DERIVED_FIELDS`).
+
+    Entries are only valid for the indicator maps they were derived with. Call
+    `use_vocabulary` with a digest of the maps before use, and the cache empties itself
+    if they've changed. With a `path`, entries are loaded from (and `save`d to) a JSON
+    file: {version, vocabulary, entries: [[key, fields], ...]}, least recently used first.
+    """
+
+    def __init__(self, path: str | Path = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.vocabulary = None
+        self.entries: OrderedDict[tuple, tuple] = OrderedDict()
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stored.get('version') == FIELD_CACHE_FORMAT_VERSION:
+            self.vocabulary = stored.get('vocabulary')
+            self.entries.update((tuple(key), tuple(fields)) for key, fields in stored.get('entries', []))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def use_vocabulary(self, vocabulary: str):
+        """Drops every entry if they were derived with other indicator maps."""
+        if vocabulary != self.vocabulary:
+            self.entries.clear()
+            self.vocabulary = vocabulary
+
+    def get(self, key: tuple) -> tuple | None:
+        fields = self.entries.get(key)
+        if fields is not None:
+            self.entries.move_to_end(key)
+        return fields
+
+    def put(self, key: tuple, fields: tuple):
+        self.entries[key] = fields
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        stored = {
+            'version': FIELD_CACHE_FORMAT_VERSION,
+            'vocabulary': self.vocabulary,
+            'entries': [[list(key), list(fields)] for key, fields in self.entries.items()],
+        }
+        with open(self.path, 'w') as f:
+            json.dump(stored, f)
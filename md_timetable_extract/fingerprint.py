@@ -0,0 +1,150 @@
+# Description: Cheap, deterministic fingerprints of PDF pages, used to recognise
+# pages that have already been extracted.
+
+import hashlib
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, ContentStream, DictionaryObject, IndirectObject, StreamObject
+
+from md_timetable_extract.pdf_source import open_source_document
+
+# content stream operators that construct, paint or transform paths (i.e. the table grid)
+DRAWING_OPERATORS = {
+    b'm', b'l', b'c', b'v', b'y', b'h', b're',
+    b'S', b's', b'f', b'F', b'f*', b'B', b'B*', b'b', b'b*', b'n',
+    b'W', b'W*', b'cm', b'q', b'Q',
+}
+
+
+@dataclass
+class PageFingerprint:
+    """What a page says (`text`) and a digest of its text and drawings."""
+    page_number: int
+    text: str
+    digest: str
+
+
+def page_content_hash(pdf_path: str, page: int) -> str:
+    """Returns a hash of everything that determines how `page` (1-based) is drawn:
+    its content stream, resources (fonts, images, forms), media box and rotation.
+
+    Identical pages get the same hash even across different files, so the hash
+    can be used as a content address.
+    """
+    stat = os.stat(pdf_path)
+    return _page_content_hashes(os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)[page - 1]
+
+
+@lru_cache(maxsize=8)
+def _page_content_hashes(pdf_path: str, mtime_ns: int, size: int) -> tuple[str, ...]:
+    # `mtime_ns` and `size` are only part of the cache key, so edited files are rehashed
+    reader = PdfReader(pdf_path, strict=False)
+    hashes = []
+    for pdf_page in reader.pages:
+        h = hashlib.sha256()
+        h.update(repr([float(x) for x in pdf_page.mediabox]).encode())
+        h.update(repr(pdf_page.rotation).encode())
+        seen = {}
+        if pdf_page.indirect_reference is not None:
+            seen[pdf_page.indirect_reference.idnum] = 0
+        _update_hash(h, pdf_page, seen)
+        hashes.append(h.hexdigest())
+    return tuple(hashes)
+
+
+def _update_hash(h, obj, seen: dict[int, int]):
+    """Feeds a pdf object into `h`, following references but not the page tree.
+
+    `seen` maps object numbers to the order they were first visited in, so repeated
+    references hash the same regardless of how the file numbers its objects.
+    """
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            h.update(f"<ref {seen[obj.idnum]}>".encode())
+            return
+        seen[obj.idnum] = len(seen)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        _update_hash(h, DictionaryObject(obj), seen)
+        h.update(obj.get_data())
+    elif isinstance(obj, DictionaryObject):
+        for key in sorted(obj.keys()):
+            if key == '/Parent':
+                continue
+            h.update(key.encode())
+            _update_hash(h, obj.raw_get(key), seen)
+    elif isinstance(obj, ArrayObject):
+        h.update(b"[")
+        for item in obj:
+            _update_hash(h, item, seen)
+        h.update(b"]")
+    else:
+        h.update(repr(obj).encode())
+
+# operators that add a ruling segment (or a rectangle of them) to the current path
+RULING_OPERATORS = {b'l': 1, b're': 4}
+HEADER_SHAPE_LINES = 3
+
+
+def page_fingerprints(pdf_path: str) -> list[PageFingerprint]:
+    """Fingerprints every page by its extracted text and its drawing operations.
+
+    Unlike `page_content_hash`, this ignores how the file is encoded (fonts, object
+    layout, metadata), so re-exports of an unchanged page still match.
+    """
+    reader = PdfReader(pdf_path, strict=False)
+    fingerprints = []
+    for i, pdf_page in enumerate(reader.pages):
+        text = re.sub(r'[ \t]+', ' ', pdf_page.extract_text() or '').strip()
+        h = hashlib.sha256(text.encode())
+        h.update(repr([round(float(x), 1) for x in pdf_page.mediabox]).encode())
+        h.update(repr(pdf_page.rotation).encode())
+        contents = pdf_page.get_contents()
+        if contents is not None:
+            for operands, operator in ContentStream(contents, reader).operations:
+                if operator in DRAWING_OPERATORS:
+                    h.update(operator)
+                    h.update(repr([round(float(x), 1) for x in operands]).encode())
+        fingerprints.append(PageFingerprint(i + 1, text, h.hexdigest()))
+    return fingerprints
+
+
+def layout_fingerprint(pdf_path: str, page: int) -> str:
+    """A coarse description of a page's layout, shared by pages that look alike:
+    its size, its number of ruling segments (rounded to a power of two) and the shape
+    of its first few text lines (letter runs -> 'a', digit runs -> '9').
+
+    e.g. '842x595|lines~512|a 9/a/a 9 a 9'
+
+    The page is read from this process's open `pdf_source.SourceDocument`.
+    """
+    source = open_source_document(pdf_path)
+    with source.lock:
+        return _layout_fingerprint(source.pypdf_reader(), page)
+
+
+def _layout_fingerprint(reader: PdfReader, page: int) -> str:
+    pdf_page = reader.pages[page - 1]
+    width, height = (round(float(x)) for x in (pdf_page.mediabox.width, pdf_page.mediabox.height))
+    if pdf_page.rotation % 180:
+        width, height = height, width
+
+    n_segments = 0
+    contents = pdf_page.get_contents()
+    if contents is not None:
+        for _, operator in ContentStream(contents, reader).operations:
+            n_segments += RULING_OPERATORS.get(operator, 0)
+    segments_bucket = 2 ** round(math.log2(n_segments)) if n_segments else 0
+
+    text_lines = [line.strip() for line in (pdf_page.extract_text() or '').splitlines() if line.strip()]
+    header_shape = '/'.join(_text_shape(line) for line in text_lines[:HEADER_SHAPE_LINES])
+    return f"{width}x{height}|lines~{segments_bucket}|{header_shape}"
+
+
+def _text_shape(text: str) -> str:
+    return re.sub(r'\d+', '9', re.sub(r'[^\W\d_]+', 'a', text))
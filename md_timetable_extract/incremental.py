@@ -0,0 +1,111 @@
+# Description: Re-extract only the pages that changed between two versions of a
+# timetable, reusing the previous version's output for the rest.
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from md_timetable_extract import extract, fingerprint, structs, times, triage
+
+
+@dataclass
+class IncrementalPlan:
+    """Which pages of the new timetable need extracting, and which weeks can be
+    taken from the previous output (keyed by page number in the new timetable)."""
+    pages_to_extract: list[int] = field(default_factory=list)
+    reused_weeks: dict[int, int] = field(default_factory=dict)
+
+
+def plan_incremental_extraction(previous_pdf: str, pdf_path: str, ignore_pages: list[int] = None,
+                                start_page: int = 1) -> IncrementalPlan:
+    """Compares page fingerprints of two timetable versions.
+
+    Pages before `start_page` or in `ignore_pages` are left out. If `ignore_pages` is
+    None, so are pages that don't triage as week calendar pages, as in
+    `extract.iter_weekly_calendar_views`.
+
+    A page is reused if it triages as a calendar page (see `triage.triage_pages`),
+    a page with the same fingerprint exists anywhere in the previous version (so
+    inserted or removed pages don't invalidate the rest), and no other calendar page of
+    its week changed. Everything else is re-extracted.
+    """
+    previous_digests = {fp.digest for fp in fingerprint.page_fingerprints(previous_pdf)}
+    fingerprints = [fp for fp in fingerprint.page_fingerprints(pdf_path)
+                    if fp.page_number >= start_page and (ignore_pages is None or fp.page_number not in ignore_pages)]
+    # triaged from the same text as extraction triages from, so both agree on each page's week
+    page_triages = triage.triage_pages(pdf_path, [fp.page_number for fp in fingerprints])
+    plan = IncrementalPlan()
+    unchanged_weeks: dict[int, int] = {}
+    changed_weeks = set()
+    for fp, page_triage in zip(fingerprints, page_triages):
+        if ignore_pages is None and not page_triage.is_calendar:
+            print(f"  - Skipping page {fp.page_number} ({page_triage.kind} page)")
+            continue
+        if page_triage.is_calendar and fp.digest in previous_digests:
+            unchanged_weeks[fp.page_number] = page_triage.week
+        else:
+            plan.pages_to_extract.append(fp.page_number)
+            if page_triage.is_calendar:
+                changed_weeks.add(page_triage.week)
+
+    # a week is only reused if none of its pages changed
+    for page, week in unchanged_weeks.items():
+        if week in changed_weeks:
+            plan.pages_to_extract.append(page)
+        else:
+            plan.reused_weeks[page] = week
+    plan.pages_to_extract.sort()
+    return plan
+
+
+def read_previous_events(previous_output: str | Path) -> pd.DataFrame:
+    """Reads a previously scraped timetable CSV, keeping cell text exactly as written
+    (apart from the start and end times, which are read as minutes since midnight).
+    A 'wk' column, as written by `runner.add_my_custom_columns`, is read as 'week'."""
+    df = pd.read_csv(previous_output, dtype=str, keep_default_na=False)
+    if 'week' not in df.columns and 'wk' in df.columns:
+        df = df.rename(columns={'wk': 'week'})
+    if 'week' not in df.columns:
+        raise ValueError(f"Previous output {previous_output} has no 'week' column")
+    df['week'] = df['week'].astype(int)
+    return times.to_time_columns(df)
+
+
+def get_weekly_calendar_views_incrementally(previous_pdf: str, previous_output: str | Path, pdf_path: str,
+                                            ignore_pages: list[int] = None, start_page: int = 1, **kwargs
+                                            ) -> tuple[list[structs.CalendarWeekView], pd.DataFrame]:
+    """Extracts only the pages that changed since `previous_pdf`.
+
+    Returns the calendar views of the changed pages, and the rows of
+    `previous_output` for the unchanged weeks. A week found on a changed page is never
+    also reused: if extraction finds a week that was planned for reuse, that week's
+    unchanged pages are extracted as well. Other keyword arguments are passed to
+    `extract.get_weekly_calendar_views`.
+    """
+    plan = plan_incremental_extraction(previous_pdf, pdf_path, ignore_pages, start_page)
+
+    def extract_pages(pages: list[int]) -> list[structs.CalendarWeekView]:
+        if not pages:
+            return []
+        return extract.get_weekly_calendar_views(pdf_path, ignore_pages=ignore_pages, start_page=start_page,
+                                                 pages=','.join(str(page) for page in pages), **kwargs)
+
+    calendar_views = extract_pages(plan.pages_to_extract)
+    extracted_weeks = {view.week for view in calendar_views}
+    overlapping_pages = [page for page, week in plan.reused_weeks.items() if week in extracted_weeks]
+    if overlapping_pages:
+        # extracted again together, so each week's pages stay in page order
+        print(f"Weeks {sorted(extracted_weeks & set(plan.reused_weeks.values()))} also changed, "
+              f"extracting pages {overlapping_pages} too")
+        for page in overlapping_pages:
+            del plan.reused_weeks[page]
+        plan.pages_to_extract = sorted(plan.pages_to_extract + overlapping_pages)
+        calendar_views = extract_pages(plan.pages_to_extract)
+        extracted_weeks = {view.week for view in calendar_views}
+    print(f"Reusing weeks {sorted(set(plan.reused_weeks.values()))} from {Path(previous_output).name}")
+
+    previous_events = read_previous_events(previous_output)
+    reused_weeks = set(plan.reused_weeks.values()) - extracted_weeks
+    reused_events = previous_events[previous_events['week'].isin(reused_weeks)]
+    return calendar_views, reused_events
@@ -0,0 +1,55 @@
+# Description: Indicator maps (key -> list of indicators, see `post_processing`) compiled
+# into a single regex, so the first key with a matching indicator is found in one call.
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+@dataclass(frozen=True)
+class IndicatorMatcher:
+    """An indicator map compiled into one pattern.
+
+    Each key becomes an alternative `(?=.*?(?:<its indicators>))` anchored at the
+    start of the text. Alternatives are tried in map order, so the key that matches is
+    the first one in the map with any matching indicator. This is the same key that
+    looping over the map would give.
+    """
+    pattern: re.Pattern
+    keys: tuple[str, ...]
+    plain: bool
+
+    def first_key(self, content: str) -> str | None:
+        """The first key with an indicator in `content`, or None."""
+        content = content.strip().lower() if self.plain else content.strip()
+        match = self.pattern.match(content)
+        return self.keys[int(match.lastgroup[1:])] if match else None
+
+
+def indicator_matcher(indicator_map: dict[str, list[str]], plain: bool = False) -> IndicatorMatcher:
+    """The compiled matcher for `indicator_map`, reused until the map's contents change.
+
+    With `plain`, indicators are case-insensitive substrings (like
+    `post_processing.standardise_from_indicator`). Otherwise they are regexes searched
+    for case-insensitively, like `post_processing.find_indicator`. Global inline
+    flags like `(?i)` aren't supported inside regex indicators.
+    """
+    return _compile_indicator_map(tuple((key, tuple(indicators)) for key, indicators in indicator_map.items()),
+                                  plain)
+
+
+@lru_cache(maxsize=32)
+def _compile_indicator_map(entries: tuple[tuple[str, tuple[str, ...]], ...], plain: bool) -> IndicatorMatcher:
+    alternatives = []
+    keys = []
+    for key, indicators in entries:
+        if not indicators:
+            continue
+        if plain:
+            indicators = [re.escape(indicator.lower()) for indicator in indicators]
+        alternatives.append(f"(?=(?s:.*?)(?:{'|'.join(indicators)}))(?P<k{len(keys)}>)")
+        keys.append(key)
+    if not alternatives:
+        return IndicatorMatcher(re.compile(r'(?!)'), (), plain)
+    flags = 0 if plain else re.IGNORECASE
+    return IndicatorMatcher(re.compile('|'.join(alternatives), flags), tuple(keys), plain)
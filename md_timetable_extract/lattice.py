@@ -0,0 +1,260 @@
+# Description: Camelot lattice parsing of a page that is laid out and rasterised
+# once, straight from the source PDF, then re-parsed with as many line scales as needed.
+
+import threading
+from pathlib import Path
+
+import camelot
+import cv2
+import numpy as np
+import pandas as pd
+from camelot.backends import ImageConversionBackend
+from camelot.backends.image_conversion import BACKENDS
+from camelot.image_processing import find_contours, find_joints, find_lines
+from camelot.parsers import Lattice
+from camelot.utils import get_image_char_and_text_objects, get_rotation, merge_close_lines, scale_image
+
+from md_timetable_extract import ruling, structs
+from md_timetable_extract.pdf_source import open_source_document, worker_temp_dir
+
+# how table grids are found: from an image of the page, or from the lines the PDF draws
+LATTICE_ENGINE = 'lattice'
+VECTOR_ENGINE = 'vector'
+ENGINES = (LATTICE_ENGINE, VECTOR_ENGINE)
+
+# backends that can rasterise a page, see `bin/benchmark_backends.py` to compare them
+RASTER_BACKENDS = tuple(BACKENDS)
+DEFAULT_RASTER_BACKEND = 'pdfium'
+
+
+class PreparedPage:
+    """A single page of a PDF, prepared for lattice parsing.
+
+    Running pdfminer's layout analysis, rendering the page to an image and
+    thresholding that image only depend on the page, so they are done once (on first
+    use) and shared by every `extract_tables` call, whatever its `line_scale`.
+    `extract_tables` can be called from several threads at once. A prepared page can
+    be pickled and parsed in other processes without being prepared again.
+
+    Pages are read from the process's memory-mapped `pdf_source.SourceDocument`, not
+    split into their own files like `camelot.read_pdf` does. A single page file is
+    only written (to the worker's temp dir) for backends that can only render files,
+    or if the page's text is rotated and camelot needs to rotate the page.
+
+    `backend` is the camelot image conversion backend used to rasterise the page
+    (one of `RASTER_BACKENDS`). If it isn't available, camelot falls back to another.
+
+    Use as a context manager (or call `close`) to remove any files written for the page.
+    """
+
+    def __init__(self, pdf_path: str, page: int, backend: str = DEFAULT_RASTER_BACKEND):
+        if backend not in RASTER_BACKENDS:
+            raise ValueError(f"Unknown raster backend {backend!r}, expected one of {RASTER_BACKENDS}")
+        self.pdf_path = pdf_path
+        self.page = int(page)
+        self.backend = backend
+        self.page_path: str = None  # single page file, if one had to be written
+        self.layout = None
+        self.dimensions: tuple[float, float] = None
+        self.images = None
+        self.horizontal_text = None
+        self.vertical_text = None
+        self.image = None
+        self.threshold = None
+        self._lock = threading.Lock()
+        self._written_files: list[Path] = []
+
+    def __getstate__(self):
+        # sent to other processes without its lock, and without the files it wrote,
+        # which the original removes when it's closed
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_written_files'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_prepared(self) -> bool:
+        return self.threshold is not None
+
+    def prepare(self) -> 'PreparedPage':
+        with self._lock:
+            if self.layout is None:
+                self._load_layout()
+            if not self.is_prepared:
+                self._threshold_image(self._render_page())
+        return self
+
+    def prepare_layout(self) -> 'PreparedPage':
+        """Like `prepare`, but without rendering the page (all the vector engine needs)."""
+        with self._lock:
+            if self.layout is None:
+                self._load_layout()
+        return self
+
+    def _load_layout(self):
+        """Runs pdfminer's layout analysis on the page."""
+        source = open_source_document(self.pdf_path)
+        with source.lock:
+            self.layout, self.dimensions = source.page_layout(self.page)
+        self.images, chars, self.horizontal_text, self.vertical_text = get_image_char_and_text_objects(self.layout)
+        if get_rotation(chars, self.horizontal_text, self.vertical_text):
+            # let camelot write out and lay out a rotated copy, as it would have
+            self._split_page()
+
+    def _split_page(self):
+        temp_dir = worker_temp_dir()
+        handler = camelot.handlers.PDFHandler(self.pdf_path)
+        self.layout, self.dimensions, self.images, _, self.horizontal_text, self.vertical_text = (
+            handler._save_page(self.pdf_path, self.page, str(temp_dir))
+        )
+        self.page_path = str(temp_dir / f"page-{self.page}.pdf")
+        self._written_files += [Path(self.page_path), temp_dir / f"p-{self.page}_rotated.pdf"]
+
+    def _render_page(self, use_fallback: bool = True) -> np.ndarray:
+        """Rasterises the page with `backend` and returns it as a BGR image."""
+        source = open_source_document(self.pdf_path)
+        if self.backend == 'pdfium' and self.page_path is None:
+            with source.lock:
+                return source.render(self.page)
+
+        temp_dir = worker_temp_dir()
+        if self.page_path is None:
+            self.page_path = str(temp_dir / f"page-{self.page}.pdf")
+            self._written_files.append(Path(self.page_path))
+            with source.lock:
+                source.write_page(self.page, self.page_path)
+        image_path = temp_dir / f"page-{self.page}.png"
+        self._written_files.append(image_path)
+        ImageConversionBackend(self.backend, use_fallback=use_fallback).convert(self.page_path, str(image_path))
+        return cv2.imread(str(image_path))
+
+    def _threshold_image(self, image: np.ndarray):
+        # `camelot.image_processing.adaptive_threshold` with camelot's Lattice defaults,
+        # minus reading the image from a file
+        self.image = image
+        gray = np.invert(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        self.threshold = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, -2)
+
+    def close(self):
+        for path in self._written_files:
+            path.unlink(missing_ok=True)
+        self._written_files = []
+
+    def extract_tables(self, line_scale: int) -> list[camelot.core.Table]:
+        """Lattice-parses the page with the given `line_scale`, like
+        `camelot.read_pdf(..., flavor='lattice')` does for a single page.
+        See `resolve_spans` for the tables' `df` and `spans`."""
+        self.prepare()
+        return self._parse(_PreparedLattice(self, line_scale=line_scale))
+
+    def extract_vector_tables(self) -> list[camelot.core.Table]:
+        """Parses the page like `extract_tables`, but builds the table grids from the
+        ruling lines in the PDF itself (see `ruling.py`) instead of from an image of
+        the page, so there is no rendering and no `line_scale` to get right."""
+        self.prepare_layout()
+        return self._parse(_VectorLattice(self))
+
+    def _parse(self, parser: Lattice) -> list[camelot.core.Table]:
+        parser.prepare_page_parse(
+            self.page_path or self.pdf_path, self.layout, self.dimensions, self.page, self.images,
+            self.horizontal_text, self.vertical_text, layout_kwargs={},
+        )
+        tables = sorted(parser.extract_tables())
+        for table in tables:
+            texts, table.spans = resolve_spans(table)
+            table.df = pd.DataFrame(texts)
+        return tables
+
+
+def resolve_spans(table: camelot.core.Table) -> tuple[list[list[str]], list[structs.CellSpan]]:
+    """Works out which cells of `table` are merged, from their edges.
+
+    Returns the table's text with each merged cell's text copied into every cell it
+    covers (exactly what camelot's `copy_text=['v', 'h']` gives, which is what the
+    header and time column checks rely on), and the merged cells themselves, which
+    is what events are read from.
+    """
+    cells = table.cells
+    texts = [[cell.text for cell in row] for row in cells]
+    # the cell each cell's text comes from
+    anchors = [[(i, j) for j in range(len(row))] for i, row in enumerate(cells)]
+    for i, row in enumerate(cells):
+        for j, cell in enumerate(row):
+            if texts[i][j].strip() == "" and cell.vspan and not cell.top:
+                texts[i][j] += texts[i - 1][j]
+                anchors[i][j] = anchors[i - 1][j]
+    for i, row in enumerate(cells):
+        for j, cell in enumerate(row):
+            if texts[i][j].strip() == "" and cell.hspan and not cell.left:
+                texts[i][j] += texts[i][j - 1]
+                anchors[i][j] = anchors[i][j - 1]
+
+    span_cells: dict[tuple[int, int], list[tuple[int, int]]] = {}
+    for i, row in enumerate(anchors):
+        for j, (anchor_i, anchor_j) in enumerate(row):
+            if texts[anchor_i][anchor_j].strip():
+                span_cells.setdefault((anchor_i, anchor_j), []).append((i, j))
+    texts = [[text.strip() for text in row] for row in texts]
+    spans = [structs.CellSpan(texts[i][j], cells) for (i, j), cells in span_cells.items()]
+    return texts, spans
+
+
+class _PreparedLattice(Lattice):
+    """Lattice parser that takes its page image from a `PreparedPage` instead of
+    rendering and thresholding the page itself."""
+
+    def __init__(self, prepared_page: PreparedPage, **kwargs):
+        super().__init__(**kwargs)
+        self.prepared_page = prepared_page
+
+    def _generate_table_bbox(self):
+        # Lattice._generate_table_bbox without the image conversion, and without
+        # table_areas/table_regions support, which this project doesn't use
+        self.pdf_image = self.prepared_page.image
+        self.threshold = self.prepared_page.threshold
+
+        image_height, image_width = self.pdf_image.shape[:2]
+        pdf_scalers = (self.pdf_width / float(image_width), self.pdf_height / float(image_height), image_height)
+
+        vertical_mask, vertical_segments = find_lines(
+            self.threshold, direction="vertical", line_scale=self.line_scale, iterations=self.iterations,
+        )
+        horizontal_mask, horizontal_segments = find_lines(
+            self.threshold, direction="horizontal", line_scale=self.line_scale, iterations=self.iterations,
+        )
+        contours = find_contours(vertical_mask, horizontal_mask)
+        table_bbox = find_joints(contours, vertical_mask, horizontal_mask)
+
+        self.table_bbox_parses, self.vertical_segments, self.horizontal_segments = (
+            scale_image(table_bbox, vertical_segments, horizontal_segments, pdf_scalers)
+        )
+        self._set_anchors()
+
+    def _set_anchors(self):
+        """Turns each table's joints into column and row anchors (as camelot does)."""
+        for bbox, parse in self.table_bbox_parses.items():
+            joints = parse["joints"]
+            cols = [x for x, _ in joints] + [bbox[0], bbox[2]]
+            rows = [y for _, y in joints] + [bbox[1], bbox[3]]
+            parse["col_anchors"] = merge_close_lines(sorted(cols), line_tol=self.line_tol)
+            parse["row_anchors"] = merge_close_lines(sorted(rows, reverse=True), line_tol=self.line_tol)
+
+
+class _VectorLattice(_PreparedLattice):
+    """Lattice parser that takes its table grids from the page's ruling lines."""
+
+    def _generate_table_bbox(self):
+        self.vertical_segments, self.horizontal_segments = ruling.ruling_segments(self.layout)
+        tables = ruling.find_tables(self.vertical_segments, self.horizontal_segments)
+        self.table_bbox_parses = {bbox: {"joints": joints} for bbox, joints in tables.items()}
+        self._set_anchors()
@@ -0,0 +1,159 @@
+# Description: A timetable PDF opened once per process and memory-mapped, from which
+# individual pages are laid out and rendered without being split into their own files.
+
+import ctypes
+import io
+import mmap
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pypdfium2 as pdfium
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pypdf import PdfReader, PdfWriter
+
+# camelot's defaults, for layouts identical to `camelot.utils.get_page_layout`
+LAYOUT_PARAMS = dict(line_overlap=0.5, char_margin=1.0, line_margin=0.5, word_margin=0.1, boxes_flow=0.5,
+                     detect_vertical=True, all_texts=True)
+RENDER_RESOLUTION = 300  # dpi, as camelot's image conversion backends use
+
+
+class SourceDocument:
+    """A PDF mapped into memory once, shared by pdfminer (layout), pypdfium2
+    (text and rendering) and pypdf (writing single pages out, when a file is unavoidable).
+
+    Each library reads the same mapping through its own cursor, so the file is
+    never read into memory as a whole and no library moves another's read position. None of them are thread
+    safe, so hold `lock` while using a document from several threads.
+    Use `open_source_document` rather than creating these directly.
+    """
+
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+        self.lock = threading.RLock()
+        with open(pdf_path, 'rb') as f:
+            # copy-on-write, so pdfium can take a (writable) ctypes view of it
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        self._miner_document = PDFDocument(PDFParser(_MappedCursor(self._data)))
+        self._miner_pages = list(PDFPage.create_pages(self._miner_document))
+        self._resource_manager = PDFResourceManager()
+        self._pdfium_document = None
+        self._reader = None
+
+    def __len__(self) -> int:
+        return len(self._miner_pages)
+
+    def page_layout(self, page: int):
+        """pdfminer's layout of `page` (1-based) and its (width, height)."""
+        device = PDFPageAggregator(self._resource_manager, laparams=LAParams(**LAYOUT_PARAMS))
+        PDFPageInterpreter(self._resource_manager, device).process_page(self._miner_pages[page - 1])
+        layout = device.get_result()
+        return layout, (layout.bbox[2], layout.bbox[3])
+
+    def page_text(self, page: int) -> str:
+        """The text of `page`, as pdfium reads it (no layout analysis, so it's cheap)."""
+        text_page = self._pdfium()[page - 1].get_textpage()
+        try:
+            return text_page.get_text_range()
+        finally:
+            text_page.close()
+
+    def render(self, page: int, resolution: int = RENDER_RESOLUTION) -> np.ndarray:
+        """Rasterises `page` with pdfium, as a BGR image (like `cv2.imread` gives)."""
+        image = self._pdfium()[page - 1].render(scale=resolution / 72).to_pil()
+        return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+
+    def _pdfium(self) -> pdfium.PdfDocument:
+        if self._pdfium_document is None:
+            buffer = (ctypes.c_char * len(self._data)).from_buffer(self._data)
+            self._pdfium_document = pdfium.PdfDocument(buffer)
+            self._pdfium_document.init_forms()
+        return self._pdfium_document
+
+    def pypdf_reader(self) -> PdfReader:
+        """pypdf's reader of the document, opened on first use."""
+        if self._reader is None:
+            self._reader = PdfReader(_MappedCursor(self._data), strict=False)
+            if self._reader.is_encrypted:
+                self._reader.decrypt("")
+        return self._reader
+
+    def write_page(self, page: int, path: str | Path):
+        """Saves `page` as a single page PDF at `path`."""
+        writer = PdfWriter()
+        writer.add_page(self.pypdf_reader().pages[page - 1])
+        with open(path, 'wb') as f:
+            writer.write(f)
+
+
+@lru_cache(maxsize=4)
+def _open_source_document(pdf_path: str, mtime_ns: int, size: int) -> SourceDocument:
+    # `mtime_ns` and `size` are only part of the cache key, so edited files are reopened
+    return SourceDocument(pdf_path)
+
+
+def open_source_document(pdf_path: str) -> SourceDocument:
+    """Returns this process's `SourceDocument` for `pdf_path`, opening it on first use."""
+    stat = os.stat(pdf_path)
+    return _open_source_document(os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1)
+def _worker_temp_dir(pid: int) -> Path:
+    path = Path(tempfile.gettempdir(), 'md_timetable_extract', f'worker-{pid}')
+    path.mkdir(parents=True, exist_ok=True)
+    # unlike atexit, also runs when a multiprocessing worker exits
+    multiprocessing.util.Finalize(None, shutil.rmtree, args=(path,), kwargs={'ignore_errors': True}, exitpriority=0)
+    return path
+
+
+def worker_temp_dir() -> Path:
+    """This process's temp directory, for the few files that can't be avoided
+    (pages rendered by the ghostscript/poppler backends, rotated pages).
+
+    It's named after the process, so each worker gets its own and reuses it for
+    every page, instead of a new random directory per page.
+    """
+    return _worker_temp_dir(os.getpid())
+
+
+class _MappedCursor(io.RawIOBase):
+    """A read-only file over a shared memory map, with its own read position."""
+
+    def __init__(self, data: mmap.mmap):
+        self._data = data
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._position = max(offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        chunk = self._data[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
@@ -1,8 +1,16 @@
-from typing import Union
+from typing import Iterable, Iterator, Union
+import ast
+import hashlib
+import json
+import numpy as np
 import pandas as pd
-import octk
 import re
 
+from md_timetable_extract.description import parse_description
+from md_timetable_extract.field_cache import DerivedFieldsCache
+from md_timetable_extract.indicators import indicator_matcher
+from md_timetable_extract.times import to_time_columns
+
 found_subjects = set()
 found_presenters = set()
 found_locations = set()
@@ -110,17 +118,22 @@ type_indicators = {
     "Deadline": ["Assignment due"],
 }
 
+# the maps above, compiled once (see `indicators.indicator_matcher`).
+# `find_indicator` matchers search for regexes, `standardise_from_indicator` ones for substrings
+location_matcher = indicator_matcher(location_indicators_map, plain=True)
+subject_matcher = indicator_matcher(subject_indicators_map, plain=True)
+subject_finder = indicator_matcher(subject_indicators_map)
+presenter_matcher = indicator_matcher(presenter_indicators_map, plain=True)
+type_finder = indicator_matcher(type_indicators)
+type_from_location_matcher = indicator_matcher(type_to_location_map, plain=True)
+
 def find_indicator(indicator_map, content):
     """
     @param indicator_map: dict[str, list[str]] - key is the value to be returned, value is a list of regex indicator patterns
     @param content: str - the content to search for indicators
     @return: str - the key of the first indicator found in the content
     """
-    for key, indicators in indicator_map.items():
-        for indicator in indicators:
-            if re.search(indicator, content.strip(), re.IGNORECASE):
-                return key
-    return None
+    return indicator_matcher(indicator_map).first_key(content)
 
 def standardise_from_indicator(indicator_map, symbol):
     """
@@ -129,16 +142,27 @@ def standardise_from_indicator(indicator_map, symbol):
     returned, value is a list of indicators
     @param symbol: str - the symbol to search for
     """
-    for key, indicators in indicator_map.items():
-        for indicator in indicators:
-            if indicator.lower() in symbol.strip().lower():
-                return key
-    return None
+    return indicator_matcher(indicator_map, plain=True).first_key(symbol)
+
+
+def map_unique(values: pd.Series, func) -> pd.Series:
+    """`values.map(func)`, calling `func` only once for each distinct value."""
+    uniques = values.unique()
+    return values.map(dict(zip(uniques, map(func, uniques))))
 
 
 def remove_duplicates(df):
     return df.drop_duplicates()
 
+
+def remove_seen_duplicates(df, seen_rows: set[int]):
+    """`remove_duplicates` for a table that arrives in chunks: also drops rows already
+    in `seen_rows` (hashes of earlier chunks' rows), then adds this chunk's rows to it."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    is_new = ~row_hashes.duplicated() & ~row_hashes.isin(seen_rows)
+    seen_rows.update(row_hashes[is_new])
+    return df[is_new]
+
 def is_invalid_location(location: str) -> bool:
     invalid_locations = [
         r"\d+ hours",
@@ -158,13 +182,12 @@ def extract_location(event_description: str) -> str:
         return ""
     
     # First try to find one of the standard location indicators
-    for location, indicators in location_indicators_map.items():
-        for indicator in indicators:
-            if indicator.lower() in event_description.strip().lower():
-                return location
+    location = location_matcher.first_key(event_description)
+    if location:
+        return location
 
-    matches = [x.strip() for x in re.findall(r'\[([^\]]+)\]', event_description)]
-    return "" if not matches else matches[0]
+    bracketed = parse_description(event_description).bracketed
+    return bracketed[0].strip() if bracketed else ""
     # if matches:
     #     for match in matches:
     #         if not is_invalid_location(match):
@@ -177,65 +200,54 @@ def extract_location(event_description: str) -> str:
 
 def add_missing_location(df):
     # if 'location' column is empty, try to extract location from 'description' column
-    for index, row in df.iterrows():
-        if pd.isna(row['location']) or row['location'].strip() == "":
-            location = extract_location(row['description'])
-            df.at[index, 'location'] = location
-        found_locations.add(location)
+    is_missing = df['location'].isna() | (df['location'].str.strip() == "")
+    locations = map_unique(df.loc[is_missing, 'description'], extract_location)
+    df.loc[is_missing, 'location'] = locations
+    found_locations.update(locations)
     return df
 
 
 def set_subject(df): 
     # for missing 'subject' values, search in 'description' column
-    for index, row in df.iterrows():
-        if df.at[index, 'session_type'].lower() in [x.lower() for x in SESSION_TYPES_WITHOUT_SUBJECTS]:
-            df.at[index, 'subject'] = ""
-            continue
-        subject_0 = ""
-        if not pd.isna(row['subject']):
-            subject_0 = row['subject'].strip()
-        if subject_0:
-            ## If subject is already set, standardise it
-            subject_1 = standardise_from_indicator(subject_indicators_map, subject_0)
-        else:
-            ## If subject is not set, try to find an indicator in the description
-            subject_1 = find_indicator(subject_indicators_map, row['description'])
-        if not subject_1:
-            ## If no indicator found, use the first word of the description as the subject
-            subject_1 = row['description'].split()[0] if row['description'] else ""
-        new_subject = subject_1 if subject_1 else subject_0
-        found_subjects.add(new_subject)
-        df.at[index, 'subject'] = new_subject
-        found_subjects.add(new_subject)
+    subject_0 = df['subject'].fillna("").str.strip()
+    ## If subject is already set, standardise it.
+    ## If subject is not set, try to find an indicator in the description
+    subject_1 = map_unique(subject_0, subject_matcher.first_key).where(
+        subject_0 != "", map_unique(df['description'], subject_finder.first_key))
+    ## If no indicator found, use the first word of the description as the subject
+    first_words = map_unique(df['description'], lambda x: x.split()[0] if x else "")
+    subject_1 = subject_1.where(subject_1.notna() & (subject_1 != ""), first_words)
+    new_subject = subject_1.where(subject_1 != "", subject_0)
+
+    has_no_subject = df['session_type'].str.lower().isin([x.lower() for x in SESSION_TYPES_WITHOUT_SUBJECTS])
+    found_subjects.update(new_subject[~has_no_subject])
+    df['subject'] = new_subject.mask(has_no_subject, "")
     return df
 
 
 def set_session_type(df):
     # for missing 'session_type' values, search in 'description' column
-    for index, row in df.iterrows():
-        session_type = find_indicator(type_indicators, row['description'])
-        if session_type:
-            df.at[index, 'session_type'] = session_type
-            continue
-        # infer from location
-        elif not pd.isna(row['location']):
-            suggested_session_type = standardise_from_indicator(type_to_location_map, row['location'])
-            session_type = suggested_session_type if suggested_session_type else ""
-            if session_type:
-                df.at[index, 'session_type'] = session_type
+    session_types = map_unique(df['description'], type_finder.first_key)
+    # infer from location
+    has_location = df['location'].notna()
+    suggested_session_types = map_unique(df.loc[has_location, 'location'], type_from_location_matcher.first_key)
+    session_types = session_types.where(session_types.notna(), suggested_session_types)
+    df['session_type'] = session_types.where(session_types.notna(), df['session_type'])
     return df
 
 def extract_group_numbers(description):
-    match = re.search(r'(?i)\bGroups?\s*(\d+(\s*-\s*\d+)?)\b', description)
-    if not match:
+    # number range found after word 'Group' or 'Groups'
+    group_ranges = parse_description(description).group_ranges
+    if not group_ranges:
         return ""
     # Remove spaces and return the group numbers as a string
-    groups_substring = re.sub(" ", "", match.group(1).strip())
+    groups_substring = re.sub(" ", "", group_ranges[0].strip())
     return "'" + groups_substring if groups_substring else ""
 
 def add_groups_column(df):
     # Add a 'groups' column based on the 'description' column. Blank if session_type is lecture, otherwise uses number range found after word 'Group' or 'Groups'.
-    df['groups'] = df.apply(lambda row: extract_group_numbers(row['description']) if row['session_type'].lower() != 'lecture' else "", axis=1)
+    groups = map_unique(df['description'], extract_group_numbers)
+    df['groups'] = groups.where(df['session_type'].str.lower() != 'lecture', "")
     return df
 
 def add_groups_list_column(df):
@@ -254,38 +266,24 @@ def add_groups_list_column(df):
 
 def set_row_topic(row):
     # assume topic is after "<subject> - " and before the next '(' or '['
-    match = re.search(r'(.*?)(?:\(|\[|$)', row['description'])
-    if match:
-        # Remove the subject part from the topic
-        topic = match.group(1).strip()
-        # Remove any leading subject name if it matches the subject column
-        if row['subject'] and topic.lower().startswith(row['subject'].lower()):
-            topic = topic[len(row['subject']):].strip()
-        # remove any leading hyphen, colon or dash
-        topic = re.sub(r'^[\-\:\s]+', '', topic)
-        return topic
-
-    return match.group(1).strip() if match else ""
+    topic = parse_description(row['description']).prefix.strip()
+    # Remove any leading subject name if it matches the subject column
+    if row['subject'] and topic.lower().startswith(row['subject'].lower()):
+        topic = topic[len(row['subject']):].strip()
+    # remove any leading hyphen, colon or dash
+    return re.sub(r'^[\-\:\s]+', '', topic)
 
 def add_topics(df):
     # assume topic is after "<subject> - " and before the next '(' or '['
-    df['topic'] = df.apply(set_row_topic, axis=1)
-    return df
-
-def trim_topic(df):
-    """ Remove anything from topic after and including terms that appear in location, or a pair of brackets """
-    for index, row in df.iterrows():
-        topic = row['topic']
-        # # Check against location indicators
-        # for loc in all_location_indicators:
-        #     if loc in topic:
-        #         topic = topic.split(loc)[0].strip()
-        #         break
-        # Check for brackets
-        match = re.search(r'(.*?)(?:\(|\[|$)', topic)
-        if match:
-            topic = match.group(1).strip()
-        df.at[index, 'topic'] = topic
+    # (so, unlike the description, it has no brackets to trim)
+    topics = map_unique(df['description'], lambda x: parse_description(x).prefix.strip())
+    # Remove any leading subject name if it matches the subject column
+    topics = pd.Series([
+        topic[len(subject):].strip() if subject and topic.lower().startswith(subject.lower()) else topic
+        for topic, subject in zip(topics, df['subject'])
+    ], index=df.index, dtype=object)
+    # remove any leading hyphen, colon or dash
+    df['topic'] = topics.str.replace(r'^[\-\:\s]+', '', regex=True)
     return df
 
 def is_no_presenter(event_description: str) -> bool:
@@ -305,12 +303,11 @@ def extract_presenter(event_description: str) -> str:
     """
     if is_no_presenter(event_description):
         return "Various"
-    match = re.search(r'\(([^)]+)\)', event_description)
-    if match:
-        return match.group(1).strip()
-    match = re.search(r'\[([^\]]+)\]', event_description)
-    if match:
-        return match.group(1).strip()
+    parsed = parse_description(event_description)
+    if parsed.parenthesised:
+        return parsed.parenthesised[0].strip()
+    if parsed.bracketed:
+        return parsed.bracketed[0].strip()
     return ""
 
 def standardize_presenter_names(current_presenter):
@@ -318,13 +315,13 @@ def standardize_presenter_names(current_presenter):
     Standardizes the presenter names to its full form.
     """
     found_presenters.add(current_presenter.strip())
-    fullname = standardise_from_indicator(presenter_indicators_map, current_presenter)
+    fullname = presenter_matcher.first_key(current_presenter)
     return fullname.strip() if fullname else current_presenter.strip()
 
 
 def add_presenter_column(df):
-    df['presenter'] = df['description'].apply(extract_presenter)\
-        .apply(standardize_presenter_names)
+    presenters = map_unique(df['description'], extract_presenter)
+    df['presenter'] = map_unique(presenters, standardize_presenter_names)
     return df
 
 
@@ -345,8 +342,9 @@ def add_is_mandatory_column(df):
     If the session_type is 'Assessment', it is mandatory.
     Otherwise, it is not mandatory.
     """
-    df['is_mandatory'] = df.apply(lambda x: 1 if is_mandatory_session(x) else 0, axis=1)
-    # df['is_mandatory'] = df.apply(is_mandatory_session, axis=1)
+    is_mandatory = df['session_type'].isin(MANDATORY_SESSION_TYPES) | df['description'].str.contains(
+        '|'.join(re.escape(indicator) for indicator in MANDATORY_INDICATORS), regex=True)
+    df['is_mandatory'] = is_mandatory.astype('int64')
     return df
 
 
@@ -360,36 +358,16 @@ def drop_useless_rows(df):
     return df
 
 
-def add_event_length(row):
-    """
-    Adds an 'event_length' column to the row if 'start_time' and 'end_time' are present.
-    """
-    time_blank = False
-    if pd.isna(row['start_time']) or pd.isna(row['end_time']):
-        time_blank = True
-    if not row['start_time'] or not row['end_time']:
-        time_blank = True
-
-    if time_blank:
-        if row['location'].lower() == "online":
-            return 1
-        else:
-            return None
-
-    start_time = pd.to_datetime(row['start_time'], format='%H:%M', errors='coerce')
-    end_time = pd.to_datetime(row['end_time'], format='%H:%M', errors='coerce')
-    if pd.notna(start_time) and pd.notna(end_time):
-        return (end_time - start_time).total_seconds() / 60 / 60  # return length in hours
-    
-    return None
-
-
 def add_event_lengths(df):
     """
-    Adds an 'event_length' column to the dataframe.
-    The length is calculated as the difference between 'end_time' and 'start_time'.
+    Adds an 'event_length' column (in hours) to the dataframe.
+    The length is calculated as the difference between 'end_time' and 'start_time'
+    (minutes since midnight). Online events without times are 1 hour long; other
+    events without times have no length.
     """
-    df['event_length'] = df.apply(add_event_length, axis=1)
+    lengths = (df['end_time'] - df['start_time']).astype('float64') / 60
+    is_online = df['location'].str.lower() == "online"
+    df['event_length'] = lengths.mask(lengths.isna() & is_online, 1.0)
     return df
 
 
@@ -430,18 +408,111 @@ def drop_unwanted_groups(df, include_groups: Union[list[str], str] = "all"):
     return df[keep_mask]
 
 
-def post_process_events(df):
-    df = drop_useless_rows(df)
-    df = remove_duplicates(df)
+def group_event_index(df) -> tuple[dict[str, np.ndarray], np.ndarray]:
+    """Inverted index of the 'groups_list' column, so every group's events can be
+    picked out without filtering the table once per group (see `drop_unwanted_groups`).
+
+    Returns each group number's row positions, and the positions of the rows with no
+    groups, which are for everyone. Positions are sorted. 'groups_list' may hold lists
+    or, as read back from the scraped CSV, their text (e.g. "['1', '2']").
+    """
+    parsed: dict[str, list] = {}
+    group_rows: dict[str, list[int]] = {}
+    shared_rows = []
+    for position, groups in enumerate(df['groups_list'].tolist()):
+        if isinstance(groups, str):
+            if groups not in parsed:
+                parsed[groups] = ast.literal_eval(groups) if groups.strip() else []
+            groups = parsed[groups]
+        elif not isinstance(groups, list):  # NaN
+            groups = []
+        if not groups:
+            shared_rows.append(position)
+        for group in groups:
+            group_rows.setdefault(str(group), []).append(position)
+    index = {group: np.array(group_rows[group], dtype=np.int64) for group in sorted(group_rows, key=int)}
+    return index, np.array(shared_rows, dtype=np.int64)
+
+
+# the columns of a scraped event that the derived fields are worked out from
+FIELD_KEY_COLUMNS = ['description', 'location', 'session_type', 'subject']
+# the fields worked out from them
+DERIVED_FIELDS = ['location', 'session_type', 'subject', 'presenter', 'groups', 'topic']
+
+
+def vocabulary_digest() -> str:
+    """A hash of the indicator maps the derived fields depend on, so cached fields are
+    dropped when any of them is edited."""
+    vocabulary = [
+        location_indicators_map, subject_indicators_map, presenter_indicators_map,
+        type_to_location_map, type_indicators, SESSION_TYPES_WITHOUT_SUBJECTS,
+    ]
+    return hashlib.sha256(json.dumps(vocabulary).encode()).hexdigest()
+
+
+def derive_fields(df):
+    """Works out the `DERIVED_FIELDS` of each row from its `FIELD_KEY_COLUMNS`."""
     df = add_missing_location(df)
     df = set_session_type(df)
     df = set_subject(df)
     df = add_presenter_column(df)
     df = add_groups_column(df)
+    df = add_topics(df)
+    return df[DERIVED_FIELDS]
+
+
+def get_derived_fields(df, field_cache: DerivedFieldsCache = None) -> pd.DataFrame:
+    """The `DERIVED_FIELDS` of each row of `df`, worked out once per distinct
+    combination of `FIELD_KEY_COLUMNS` values and reused from `field_cache` if given."""
+    key_columns = df[FIELD_KEY_COLUMNS].astype(object)
+    keys = list(key_columns.where(key_columns.notna(), None).itertuples(index=False, name=None))
+    known = {}
+    if field_cache is not None:
+        field_cache.use_vocabulary(vocabulary_digest())
+        known = {key: field_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key in dict.fromkeys(keys) if known.get(key) is None]
+    if missing:
+        derived = derive_fields(pd.DataFrame(missing, columns=FIELD_KEY_COLUMNS, dtype=object))
+        for key, fields in zip(missing, derived.itertuples(index=False, name=None)):
+            known[key] = fields
+            if field_cache is not None:
+                field_cache.put(key, fields)
+    return pd.DataFrame([known[key] for key in keys], columns=DERIVED_FIELDS, index=df.index, dtype=object)
+
+
+def post_process_events(df, field_cache: DerivedFieldsCache = None):
+    df = to_time_columns(df)
+    df = drop_useless_rows(df)
+    df = remove_duplicates(df)
+    return post_process_unique_events(df, field_cache)
+
+
+def iter_post_processed_events(event_chunks: Iterable[pd.DataFrame], field_cache: DerivedFieldsCache = None
+                               ) -> Iterator[pd.DataFrame]:
+    """`post_process_events` one chunk of events (e.g. a week) at a time.
+
+    Every step but `remove_duplicates` only looks at one row, so each chunk is processed
+    as soon as it arrives. Duplicates are found from hashes of the rows seen so far,
+    which is all that's kept between chunks. Empty chunks are skipped.
+    """
+    seen_rows = set()
+    for df in event_chunks:
+        if df.empty:
+            continue
+        df = to_time_columns(df)
+        df = drop_useless_rows(df)
+        df = remove_seen_duplicates(df, seen_rows)
+        yield post_process_unique_events(df, field_cache)
+
+
+def post_process_unique_events(df, field_cache: DerivedFieldsCache = None):
+    """The steps of `post_process_events` after duplicates are removed."""
+    derived = get_derived_fields(df, field_cache)
+    for col in ['location', 'session_type', 'subject', 'presenter', 'groups']:
+        df[col] = derived[col]
     df = add_groups_list_column(df)
     df = drop_unwanted_groups(df)
-    df = add_topics(df)
-    df = trim_topic(df)
+    df['topic'] = derived['topic']
     df = add_is_mandatory_column(df)
     df = add_event_lengths(df)
     return df
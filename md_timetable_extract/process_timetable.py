@@ -1,9 +1,16 @@
 # Convert the weekly calendar layout into a list of events
 
+import calendar
+import numpy as np
 import pandas as pd
 import re
 from datetime import datetime
+from typing import Iterable, Iterator
 from dateutil.parser import parse as dateutil_parse
+from md_timetable_extract import structs
+from md_timetable_extract.description import normalise_whitespace
+from md_timetable_extract.event_table import EventTable
+from md_timetable_extract.times import parse_time
 
 valid_days = [
     "Monday",
@@ -15,81 +22,111 @@ valid_days = [
     "Sunday",
 ]
 
-def add_30_minutes(time):
-    hour, minute = time.split(":")
-    if minute == "00":
-        return f"{hour}:30"
-    else:
-        return f"{int(hour)+1}:00"
-
-
-def is_online_time_slot(event, time_slot):
-    if re.search(r"online", time_slot, flags=re.IGNORECASE):
-        return True
-    return False
-
+# the date header formats `structs.are_scraped_date_headers_valid` accepts, once commas are
+# removed: '01 January 2024' and 'Monday 01 January 2024'
+DATE_HEADER_PATTERN = re.compile(r'^(?:([A-Za-z]+)\s+)?(\d{1,2})\s+([A-Za-z]+)\s+(\d{4})$')
+MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+# the ' (n)' suffix of renamed duplicate date columns
+DUPLICATE_COLUMN_SUFFIX = re.compile(r"\(\d*\)$")
 
-def process_event(event_description:str, week_df:pd.DataFrame, date_col_name:str, week_number:int) -> dict | None:
-    event_identifier = event_description
-    event_description = re.sub(r'\s+',' ', event_description).strip()
+# length of a week view row, in minutes
+SLOT_MINUTES = 30
+# events running into the online rows at the bottom of a week end at 19:00
+ONLINE_ROWS_END_TIME = 19 * 60
 
-    if event_description == "":
-        return None
-    start_time = week_df[week_df[date_col_name] == event_identifier]["Time"].iloc[0]
-    end_time = week_df[week_df[date_col_name] == event_identifier]["Time"].iloc[-1]
 
+def parse_date_header(date_col_name:str) -> datetime:
+    """The date of a week view date column.
 
+    Headers in the formats `structs.are_scraped_date_headers_valid` accepts are read
+    directly. Anything else is left to dateutil's (much slower) fuzzy parser.
+    """
     # Handle duplicate date columns (i.e. if date_col_name has (\d*) at the end, remove it)
-    date_col_name = re.sub(r"\(\d*\)$", "", date_col_name).strip()
-    date_obj = dateutil_parse(date_col_name, fuzzy=True)
-
+    date_col_name = DUPLICATE_COLUMN_SUFFIX.sub("", date_col_name).strip()
+
+    match = DATE_HEADER_PATTERN.match(date_col_name.replace(',', '').strip())
+    if match:
+        day_name, day, month_name, year = match.groups()
+        month = MONTH_NUMBERS.get(month_name.lower())
+        if month and (day_name is None or day_name.capitalize() in valid_days):
+            try:
+                return datetime(int(year), month, int(day))
+            except ValueError:  # e.g. 31 February
+                pass
+    return dateutil_parse(date_col_name, fuzzy=True)
+
+
+def parse_date_headers(date_col_names) -> dict[str, datetime]:
+    """`parse_date_header` of each column, so a week's events share their column's date."""
+    return {name: parse_date_header(name) for name in date_col_names}
+
+
+def add_event(events:EventTable, event_identifier:str, date_obj:datetime, start_time:int | None,
+              end_time:int | None, week_number:int):
+    """Adds an event to `events` from a cell's text, the date of its column (see
+    `parse_date_header`) and the times (in minutes since midnight) of the first and
+    last rows it covers. A time of None is an online row."""
     session_type = ""
     location = ""
-    subject = ""
-    if is_online_time_slot(event_description, time_slot=start_time):
+    if start_time is None:
         location = "Online"
         session_type = "Lecture"
-        start_time = ""
-        end_time = ""
-    elif re.search(r"\d{2}:\d{2}", start_time):
-        if is_online_time_slot(event_description, time_slot=end_time):
-            end_time = "19:00"
-        else:
-            end_time = add_30_minutes(end_time)
-
-    return {
-        "week": week_number,
-        "day": date_obj.strftime("%A"),
-        "date": date_obj.strftime("%Y-%m-%d"),
-        "description": re.sub(r'\s+', ' ', event_identifier.replace("\n", " ")),
-        "start_time": start_time,
-        "end_time": end_time,
-        "location": location,
-        "session_type": session_type,
-        "subject": subject
-    }
-
-
-def get_days_events(date:str, week_number:int, week_df:pd.DataFrame) -> list[dict]:
-    events = week_df[date].unique()
-    return [
-        x
-        for x in [process_event(event, week_df, date, week_number) for event in events]
-        if x is not None
-    ]
-
-
-def process_week_days(week_number:int, weekview_df:pd.DataFrame) -> list[dict]:
-    """Transform a 'week view' dataframe (i.e. with days/dates as columns) into a list of events.
-    Each event is represented as a dictionary with keys like 'week', 'day', 'date', 'description', 'etc'.
-
-    The returned list is suitable for conversion into a pandas DataFrame for further processing.
-    
-    """
-    events = []
-    for date in weekview_df.columns[1:]:
-        day_events = get_days_events(date, week_number, week_df=weekview_df)
-        if day_events is not None:
-            events.extend(day_events)
+        end_time = None
+    elif end_time is None:
+        end_time = ONLINE_ROWS_END_TIME
+    else:
+        end_time += SLOT_MINUTES
 
+    events.append(week_number, date_obj, normalise_whitespace(event_identifier), start_time, end_time,
+                  location=location, session_type=session_type)
+
+
+def add_week_events(events:EventTable, week_number:int, week_df:pd.DataFrame):
+    """Adds an event for each distinct cell text in each date column of a week view,
+    running from the first row with that text to the last.
+
+    The first and last rows are found with one grouped pass over the whole week.
+    Events are in column order, then in order of first appearance.
+    """
+    date_columns = week_df.columns[1:]
+    n_rows = len(week_df)
+    cells = pd.DataFrame({
+        'column': np.repeat(np.arange(len(date_columns)), n_rows),
+        'text': week_df[date_columns].to_numpy().T.ravel(),
+        'row': np.tile(np.arange(n_rows), len(date_columns)),
+    })
+    rows = cells.groupby(['column', 'text'], sort=False)['row'].agg(['min', 'max'])
+
+    times = [parse_time(label) for label in week_df['Time'].tolist()]
+    dates = [parse_date_header(name) for name in date_columns]
+    for (column, text), first, last in zip(rows.index, rows['min'], rows['max']):
+        if text.strip():
+            add_event(events, text, dates[column], times[first], times[last], week_number)
+
+
+def process_week_days(week_number:int, weekview_df:pd.DataFrame,
+                      event_slots:list[structs.EventSlot] = None, events:EventTable = None) -> EventTable:
+    """Transform a 'week view' dataframe (i.e. with days/dates as columns) into events.
+    Events are appended to `events` (a new `EventTable` if not given), which is returned.
+    Its `to_frame` gives a DataFrame with columns like 'week', 'day', 'date', 'description', 'etc'
+    for further processing.
+
+    If the week view's `event_slots` are given (see `CalendarWeekView`), events are
+    built straight from them. Otherwise each event's rows are found by matching its
+    text (see `add_week_events`), which merges events in the same column that have the same text.
+    """
+    if events is None:
+        events = EventTable()
+    if event_slots is not None:
+        dates = parse_date_headers({slot.date_column for slot in event_slots})
+        for slot in event_slots:
+            add_event(events, slot.text, dates[slot.date_column], slot.start_time, slot.end_time, week_number)
+    else:
+        add_week_events(events, week_number, weekview_df)
     return events
+
+
+def iter_week_events(calendar_views:Iterable[structs.CalendarWeekView]) -> Iterator[pd.DataFrame]:
+    """The events of each week view (see `process_week_days`), one DataFrame per week."""
+    for calendar_view in calendar_views:
+        yield process_week_days(calendar_view.week, calendar_view.df, calendar_view.event_slots).to_frame()
@@ -0,0 +1,119 @@
+# Description: Table grids read straight from the ruling lines a PDF draws, in the
+# segment and joint format camelot's lattice parser works with.
+
+import numpy as np
+from pdfminer.layout import LTContainer, LTCurve, LTRect
+
+# drawings thinner than this (in points) are lines, whether stroked or filled
+THIN_DRAWING = 2.0
+# segments closer than this are treated as touching
+SEGMENT_TOL = 2.0
+# camelot drops tables with this many joints or fewer
+MIN_TABLE_JOINTS = 4
+
+Segment = tuple[float, float, float, float]
+
+
+def ruling_segments(layout) -> tuple[list[Segment], list[Segment]]:
+    """The vertical and horizontal ruling segments drawn on a pdfminer page layout.
+
+    Vertical segments are (x, y_bottom, x, y_top), horizontal ones are
+    (x_left, y, x_right, y), as camelot's lattice parser expects. Collinear
+    segments that touch or overlap are merged.
+    """
+    vertical, horizontal = [], []
+    for obj in _drawings(layout):
+        x0, y0, x1, y1 = obj.bbox
+        if isinstance(obj, LTRect):
+            if obj.width <= THIN_DRAWING:
+                vertical.append(((x0 + x1) / 2, y0, (x0 + x1) / 2, y1))
+            elif obj.height <= THIN_DRAWING:
+                horizontal.append((x0, (y0 + y1) / 2, x1, (y0 + y1) / 2))
+            elif obj.stroke:
+                vertical += [(x0, y0, x0, y1), (x1, y0, x1, y1)]
+                horizontal += [(x0, y0, x1, y0), (x0, y1, x1, y1)]
+        elif obj.stroke:
+            for (ax, ay), (bx, by) in zip(obj.pts, obj.pts[1:]):
+                if abs(ax - bx) <= THIN_DRAWING:
+                    vertical.append(((ax + bx) / 2, min(ay, by), (ax + bx) / 2, max(ay, by)))
+                elif abs(ay - by) <= THIN_DRAWING:
+                    horizontal.append((min(ax, bx), (ay + by) / 2, max(ax, bx), (ay + by) / 2))
+    vertical = [(x, y0, x, y1) for x, y0, y1 in _merge_collinear([(v[0], v[1], v[3]) for v in vertical])]
+    horizontal = [(x0, y, x1, y) for y, x0, x1 in _merge_collinear([(h[1], h[0], h[2]) for h in horizontal])]
+    return vertical, horizontal
+
+
+def _drawings(container):
+    for obj in container:
+        if isinstance(obj, LTCurve):  # includes LTLine and LTRect
+            yield obj
+        elif isinstance(obj, LTContainer):  # e.g. LTFigure
+            yield from _drawings(obj)
+
+
+def _merge_collinear(segments: list[tuple[float, float, float]]) -> list[tuple[float, float, float]]:
+    """Merges (position, start, end) segments at the same position (within
+    `SEGMENT_TOL`) whose extents touch or overlap."""
+    merged = []
+    for position, start, end in sorted(segments):
+        for i in range(len(merged) - 1, -1, -1):
+            m_position, m_start, m_end = merged[i]
+            if position - m_position > SEGMENT_TOL:
+                merged.append((position, start, end))
+                break
+            if start <= m_end + SEGMENT_TOL and end >= m_start - SEGMENT_TOL:
+                merged[i] = (m_position, min(start, m_start), max(end, m_end))
+                break
+        else:
+            merged.append((position, start, end))
+    return merged
+
+
+def find_tables(vertical: list[Segment], horizontal: list[Segment]
+                ) -> dict[tuple[float, float, float, float], list[tuple[float, float]]]:
+    """Groups segments into tables of connected rulings.
+
+    Returns each table's bbox (x_left, y_bottom, x_right, y_top) with the joints
+    (x, y) where its rulings cross, like `camelot.image_processing.find_joints` does
+    (but in PDF coordinates). Tables with `MIN_TABLE_JOINTS` joints or fewer are dropped.
+    """
+    if not vertical or not horizontal:
+        return {}
+    v = np.array(vertical)
+    h = np.array(horizontal)
+    # crosses[i, j]: vertical segment i meets horizontal segment j
+    crosses = (
+        (h[None, :, 0] - SEGMENT_TOL <= v[:, None, 0]) & (v[:, None, 0] <= h[None, :, 2] + SEGMENT_TOL)
+        & (v[:, None, 1] - SEGMENT_TOL <= h[None, :, 1]) & (h[None, :, 1] <= v[:, None, 3] + SEGMENT_TOL)
+    )
+
+    # union-find over segments, vertical ones first then horizontal ones
+    parent = list(range(len(v) + len(h)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(crosses)):
+        parent[root(i)] = root(len(v) + j)
+
+    components: dict[int, tuple[list[int], list[int]]] = {}
+    for i in range(len(v)):
+        components.setdefault(root(i), ([], []))[0].append(i)
+    for j in range(len(h)):
+        components.setdefault(root(len(v) + j), ([], []))[1].append(j)
+
+    tables = {}
+    for v_idx, h_idx in components.values():
+        if not v_idx or not h_idx:
+            continue
+        joint_v, joint_h = np.nonzero(crosses[np.ix_(v_idx, h_idx)])
+        if len(joint_v) <= MIN_TABLE_JOINTS:
+            continue
+        joints = [(float(v[v_idx[i], 0]), float(h[h_idx[j], 1])) for i, j in zip(joint_v, joint_h)]
+        xs = np.concatenate([v[v_idx, 0], h[h_idx, 0], h[h_idx, 2]])
+        ys = np.concatenate([v[v_idx, 1], v[v_idx, 3], h[h_idx, 1]])
+        tables[(float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()))] = joints
+    return tables
@@ -0,0 +1,48 @@
+# Description: Remember which camelot line_scale works for which page layout, so
+# that scale is tried first next time.
+
+import json
+from pathlib import Path
+
+
+class LineScaleStats:
+    """Per layout fingerprint (see `fingerprint.layout_fingerprint`), how often each
+    line_scale was tried and how often it produced a valid calendar table.
+
+    Stored as a small JSON file: {layout: {line_scale: [successes, attempts]}}
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        try:
+            with open(self.path) as f:
+                self.stats: dict[str, dict[str, list[int]]] = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def ordered_scales(self, layout: str, scales: list[int]) -> list[int]:
+        """Reorders `scales` for a layout: scales that have worked before first (best
+        success rate first), then untried scales, then ones that have only failed.
+        Ties keep their order in `scales`.
+        """
+        layout_stats = self.stats.get(layout, {})
+
+        def rank(line_scale):
+            successes, attempts = layout_stats.get(str(line_scale), (0, 0))
+            if not attempts:
+                return (1, 0)
+            if not successes:
+                return (2, 0)
+            return (0, -successes / attempts)
+
+        return sorted(scales, key=rank)
+
+    def record(self, layout: str, line_scale: int, success: bool):
+        counts = self.stats.setdefault(layout, {}).setdefault(str(line_scale), [0, 0])
+        counts[0] += int(success)
+        counts[1] += 1
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.stats, f, indent=2, sort_keys=True)
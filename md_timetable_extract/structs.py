@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import pandas as pd
 import re
 
@@ -31,6 +31,28 @@ def get_week_number(calendar_df: pd.DataFrame) -> str:
     return week_number
 
 
+def is_valid_time_value(time_str: str) -> bool:
+    """Check if a string is a valid time value in HH:MM format.
+    Valid examples: '09:00', '14:30', '8', '08', '12', '23:59', '8.00', '08.00'
+    """
+    isValid = True
+    pattern = r'^\d{1,2}([:\.]\d{2})?$'
+    if re.match(pattern, time_str):
+        if ':' in time_str:
+            hours, minutes = map(int, time_str.split(':'))
+            if 0 <= hours < 24 and 0 <= minutes < 60:
+                return True
+        elif '.' in time_str:
+            hours, minutes = map(int, time_str.split('.'))
+            if 0 <= hours < 24 and 0 <= minutes < 60:
+                return True
+        else:
+            hours = int(time_str)
+            if 0 <= hours < 24:
+                return True
+    return False
+
+
 def are_scraped_date_headers_valid(headers: pd.Series) -> bool:
     """check if other columns are valid date headers
     valid formats:
@@ -55,10 +77,65 @@ def are_scraped_date_headers_valid(headers: pd.Series) -> bool:
 
 
 
+@dataclass
+class WeekLayout:
+    """Where everything is in a scraped week table. See `analyse_week_layout`."""
+    header_row: int = -1  # the 'Time | <date> | <date> | ...' row, -1 if there isn't one
+    time_column: int = 0
+    first_time_row: int = -1  # first row with a time in the time column, -1 if there isn't one
+    online_rows: list[int] = field(default_factory=list)  # rows whose time cell mentions 'online'
+    duplicate_columns: dict[int, int] = field(default_factory=dict)  # column -> first column with its header
+
+
+def analyse_week_layout(df: pd.DataFrame, time_column: int = 0) -> WeekLayout:
+    """Finds the header row, first time row and online rows of a scraped week table
+    in a single pass over its time column, and which header columns repeat an earlier one."""
+    layout = WeekLayout(time_column=time_column)
+    for i, cell in enumerate(df.iloc[:, time_column].tolist()):
+        lowered = cell.lower()
+        if layout.header_row == -1 and lowered.strip() == 'time' and are_scraped_date_headers_valid(df.iloc[i]):
+            layout.header_row = i
+        if layout.first_time_row == -1 and is_valid_time_value(cell):
+            layout.first_time_row = i
+        if 'online' in lowered:
+            layout.online_rows.append(i)
+
+    if layout.header_row != -1:
+        headers = df.iloc[layout.header_row].tolist()
+        headers[time_column] = 'Time'
+        first_column_of = {}
+        for i, header in enumerate(headers):
+            if header in first_column_of:
+                layout.duplicate_columns[i] = first_column_of[header]
+            else:
+                first_column_of[header] = i
+    return layout
+
+
+@dataclass
+class CellSpan:
+    """A (possibly merged) cell of an extracted table: its text and the
+    (row, column) grid positions it covers."""
+    text: str
+    cells: list[tuple[int, int]]
+
+
+@dataclass
+class EventSlot:
+    """Where an event cell sits in a standardised week view: the date column it is
+    in, its text, and the times (minutes since midnight) of the first and last rows it
+    covers. A time of None is one of the online rows at the bottom of the week."""
+    date_column: str
+    text: str
+    start_time: int | None
+    end_time: int | None
+
+
 @dataclass
 class CalendarWeekView:
     week: int
     df: pd.DataFrame
+    event_slots: list[EventSlot] = None
 
 
     # def __post_init__(self):
@@ -93,6 +170,8 @@ class ScrapedWeekRaw:
     date_row_index: int = None
     time_column_index: int = None
     is_valid: bool = None
+    spans: list[CellSpan] = None
+    layout: WeekLayout = None
 
 
     def __post_init__(self):
@@ -100,8 +179,8 @@ class ScrapedWeekRaw:
 
 
     @classmethod
-    def from_df(cls, page_number: int, df: pd.DataFrame):
-        return ScrapedWeekRaw(page_number, df)
+    def from_df(cls, page_number: int, df: pd.DataFrame, spans: list[CellSpan] = None):
+        return ScrapedWeekRaw(page_number, df, spans=spans)
     
 
     def is_calendar_view_df_valid(self) -> bool:
@@ -110,10 +189,12 @@ class ScrapedWeekRaw:
         # example:
         # Time | Monday <date> | Tuesday <date> | ...
         EXPECTED_NUM_COLUMNS = 6 # Time + 5 weekdays
-        self.date_row_index = self.find_header_row_index()
+        self.layout = analyse_week_layout(self.df)
+        self.date_row_index = self.layout.header_row
         if self.date_row_index == -1:
             print(f"    - No valid header row found in extracted calendar view")
             return False
+        self.time_column_index = self.layout.time_column
         header_row = self.df.iloc[self.date_row_index]
         # extract may have *more* than expected columns due to the camelot splits columns when there are two events in one time slot
         if len(header_row) < EXPECTED_NUM_COLUMNS:
@@ -126,18 +207,7 @@ class ScrapedWeekRaw:
             print(f"    - Not enough unique columns in calendar view: {len(header_row.unique())}")
             return False
 
-        # # todo: only check first column
-        # required_columns = ['Time']
-        
-        # if second_row[0].strip() not in required_columns:
-        #     return False
-        
-
-        # TODO: this call maybe redundant since this check is in `structs.find_header_row_index`
-        if not are_scraped_date_headers_valid(header_row):
-            print(f"    - Invalid date headers found in extracted calendar view")
-            return False
-        
+        # the date headers were validated when the header row was found
         self.is_valid = True
         return True
     
@@ -147,14 +217,42 @@ class ScrapedWeekRaw:
         Time | [day] <date> | [day] <date> | ...
         Returns the index of the header row, or -1 if not found.
         """
+        return analyse_week_layout(self.df).header_row
 
-        for i, row in self.df.iterrows():
-            first_cell = row.iloc[0].strip().lower()
-            if first_cell == 'time':
-                self.time_column_index = 0
-                self.date_row_index = i
-                if are_scraped_date_headers_valid(row):
-                    return i
-        return -1
-    
 
+
+@dataclass
+class PageExtractionResult:
+    """Outcome of extracting a single page. `week_view` is None if the page failed.
+    `line_scale` is the scale that gave a valid table, `invalid_scales` the ones that didn't.
+    `layout` is the page's layout fingerprint, if line scale stats were used."""
+    page_number: int
+    week_view: CalendarWeekView = None
+    layout: str = None
+    line_scale: int = None
+    invalid_scales: list[int] = field(default_factory=list)
+    error: str = None
+    log: str = ""
+
+
+
+@dataclass
+class ScaleAttempt:
+    """One extraction attempt of a page at a given camelot `line_scale`.
+    `priority` is the attempt's position in the preferred scale order (lower is preferred)."""
+    line_scale: int
+    priority: int = 0
+    scraped_week_raw: ScrapedWeekRaw = None
+    accuracy: float = 0.0
+    whitespace: float = 100.0
+    log: str = ""
+
+    @property
+    def is_valid(self) -> bool:
+        return self.scraped_week_raw is not None and bool(self.scraped_week_raw.is_valid)
+
+    @property
+    def score(self) -> tuple:
+        """Higher is better: validity first, then camelot accuracy, then less whitespace,
+        then the preferred scale order."""
+        return (self.is_valid, self.accuracy, -self.whitespace, -self.priority)
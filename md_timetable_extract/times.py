@@ -0,0 +1,49 @@
+# Description: Times of day as integer minutes since midnight, which is how events
+# carry their start and end times through the pipeline. They're only formatted as
+# 'HH:MM' text when written out.
+
+import re
+
+import pandas as pd
+
+# nullable, so events without a time (online lectures) hold <NA>
+TIME_DTYPE = 'Int16'
+TIME_COLUMNS = ('start_time', 'end_time')
+
+TIME_LABEL_PATTERN = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*$')
+
+
+def parse_time(label: str) -> int | None:
+    """'HH:MM' (or 'H:MM') -> minutes since midnight, or None if `label` isn't a time."""
+    match = TIME_LABEL_PATTERN.match(label) if isinstance(label, str) else None
+    if match is None:
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def format_time(minutes) -> str:
+    """Minutes since midnight -> 'HH:MM', or '' for a missing time."""
+    if minutes is None or pd.isna(minutes):
+        return ""
+    return f"{int(minutes) // 60:02}:{int(minutes) % 60:02}"
+
+
+def to_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Stores `TIME_COLUMNS` as minutes since midnight. Text times (e.g. read back from
+    a scraped CSV) are parsed; blanks become <NA>."""
+    for col in TIME_COLUMNS:
+        if col in df.columns:
+            values = df[col]
+            if values.dtype == object:
+                values = values.map(lambda v: parse_time(v) if isinstance(v, str) else v)
+            df[col] = values.astype(TIME_DTYPE)
+    return df
+
+
+def format_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """A copy of `df` with `TIME_COLUMNS` formatted as 'HH:MM' text, for writing out."""
+    df = df.copy()
+    for col in TIME_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(format_time).astype(object)
+    return df
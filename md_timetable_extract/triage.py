@@ -0,0 +1,61 @@
+# Description: Cheap text-only classification of timetable pages, so only week
+# calendar pages are sent through (slow) lattice extraction.
+
+import re
+from dataclasses import dataclass
+
+from md_timetable_extract.pdf_source import open_source_document
+
+CALENDAR = 'calendar'
+KEY = 'key'
+OTHER = 'other'
+
+# a calendar page has a date header for each weekday (see `structs.ScrapedWeekRaw`)
+MIN_DATE_HEADERS = 5
+# text versions of the header checks in `structs`: 'Week 01', 'Time' and dates like
+# '01 January 2024' or 'Monday, 01 January 2024'
+WEEK_PATTERN = re.compile(r'Week\s*(\d+)', re.IGNORECASE)
+TIME_HEADER_PATTERN = re.compile(r'^\s*Time\b', re.IGNORECASE | re.MULTILINE)
+DATE_HEADER_PATTERN = re.compile(r'\b\d{1,2}\s+[A-Za-z]+,?\s+\d{4}\b')
+KEY_TITLE_PATTERN = re.compile(r'^\s*Key\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+@dataclass
+class PageTriage:
+    """What kind of page `page_number` is: `CALENDAR`, `KEY` or `OTHER`.
+    `week` is the week number of calendar pages."""
+    page_number: int
+    kind: str
+    week: int = None
+
+    @property
+    def is_calendar(self) -> bool:
+        return self.kind == CALENDAR
+
+
+def week_number_from_text(page_text: str) -> int | None:
+    """The week number from a page's title, e.g. 'Week 01' -> 1"""
+    match = WEEK_PATTERN.search(page_text)
+    return int(match.group(1)) if match else None
+
+
+def classify_page_text(page_number: int, text: str) -> PageTriage:
+    """Classifies a page from its text alone.
+
+    Calendar pages have a 'Week NN' title, a 'Time' header and a date header for
+    each weekday. Pages that aren't, but have a line that is just 'Key', are key pages.
+    """
+    week = week_number_from_text(text)
+    n_dates = len(set(DATE_HEADER_PATTERN.findall(text)))
+    if week is not None and TIME_HEADER_PATTERN.search(text) and n_dates >= MIN_DATE_HEADERS:
+        return PageTriage(page_number, CALENDAR, week)
+    if KEY_TITLE_PATTERN.search(text):
+        return PageTriage(page_number, KEY)
+    return PageTriage(page_number, OTHER)
+
+
+def triage_pages(pdf_path: str, page_numbers: list[int]) -> list[PageTriage]:
+    """Classifies each of `page_numbers` (1-based) of `pdf_path`."""
+    source = open_source_document(pdf_path)
+    with source.lock:
+        return [classify_page_text(page, source.page_text(page)) for page in page_numbers]
@@ -1,27 +1,23 @@
 import pandas as pd 
 import octk
+import os
 import shutil
 from pathlib import Path
-
-from md_timetable_extract import extract, structs, process_timetable, post_processing
+from typing import Iterable
+
+from md_timetable_extract import extract, incremental, structs, process_timetable, post_processing, times
+from md_timetable_extract.cache import ExtractionCache
+from md_timetable_extract.event_table import EventTable
+from md_timetable_extract.field_cache import DerivedFieldsCache
+from md_timetable_extract.lattice import DEFAULT_RASTER_BACKEND, LATTICE_ENGINE
+from md_timetable_extract.scale_stats import LineScaleStats
 import md_timetable_extract.conf as conf
 
 START_FROM_PAGE = 1
-IGNORE_PAGES = conf.IGNORE_PAGES  # pages to ignore during extraction
+IGNORE_PAGES = conf.IGNORE_PAGES  # pages to ignore during extraction, None to triage them automatically
 IS_ADD_CUSTOM_COLUMNS = False # I think is here for when you need the output to match an existing table you plan to append the new one to
-
-
-calendar_views: list[structs.CalendarWeekView] = extract.get_weekly_calendar_views(conf.INPUT_TIMETABLE, ignore_pages=IGNORE_PAGES, start_page=START_FROM_PAGE)
-
-all_events = []
-for calendar_view in calendar_views:
-    week_i_events:list[dict] = process_timetable.process_week_days(calendar_view.week, calendar_view.df)
-    all_events.extend(week_i_events)
-
-df = pd.DataFrame(all_events)
-df = post_processing.post_process_events(df)
-
-output_file = octk.uniquify(conf.SCRAPED_TIMETABLE_OUTPUT_PATH)
+EXTRACTION_WORKERS = os.cpu_count() or 1  # number of processes used to extract pages in parallel
+STREAM_OUTPUT = True  # write each week to the CSV as soon as it's extracted (not with incremental extraction)
 
 
 def add_my_custom_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -73,26 +69,106 @@ def add_my_custom_columns(df: pd.DataFrame) -> pd.DataFrame:
     ]]
     return df
 
-if IS_ADD_CUSTOM_COLUMNS:
-    df = add_my_custom_columns(df)
-
-    
-# Create output directory
-output_file.parent.mkdir(parents=True, exist_ok=True)
-# Copy input timetable to output directory for reference
-shutil.copy2(conf.INPUT_TIMETABLE, output_file.parent / Path(conf.INPUT_TIMETABLE).name)
-# Save scraped timetable to CSV
-try:
-    df.to_csv(output_file, index=False)
-except Exception as e:
-    print(f"Error saving CSV file: {e}")
-else:
-    print(f"Scraped timetable saved to: {output_file}")
 
+def post_process_calendar_views(calendar_views: list[structs.CalendarWeekView], field_cache: DerivedFieldsCache = None,
+                                reused_events: pd.DataFrame = None) -> pd.DataFrame:
+    """All the events of `calendar_views`, post-processed, then merged (by week) with
+    `reused_events` from a previous run's output."""
+    events = EventTable()
+    for calendar_view in calendar_views:
+        process_timetable.process_week_days(calendar_view.week, calendar_view.df, calendar_view.event_slots, events)
 
+    df = events.to_frame()
+    if not df.empty:
+        df = post_processing.post_process_events(df, field_cache)
+    if reused_events is not None:
+        df = pd.concat([reused_events, df], ignore_index=True).sort_values('week', kind='stable')
+    return df
+
+
+def write_scraped_timetable(event_chunks: Iterable[pd.DataFrame], output_file: Path) -> bool:
+    """Writes post-processed events to the scraped timetable CSV, chunk by chunk as they arrive.
+
+    Chunks are written to a temporary file, which only replaces `output_file` once
+    they're all written. Errors producing the chunks (extraction or post-processing,
+    when they're streamed) are raised. Errors writing the file are reported, and
+    False is returned.
+    """
+    temp_file = output_file.with_name(f"{output_file.name}.partial")
+    try:
+        f = open(temp_file, 'w', newline='')
+    except OSError as e:
+        print(f"Error saving CSV file: {e}")
+        return False
+    try:
+        with f:
+            for i, df in enumerate(event_chunks):
+                if IS_ADD_CUSTOM_COLUMNS:
+                    df = add_my_custom_columns(df)
+                df = times.format_time_columns(df)
+                try:
+                    df.to_csv(f, index=False, header=i == 0)
+                except OSError as e:
+                    print(f"Error saving CSV file: {e}")
+                    return False
+        try:
+            os.replace(temp_file, output_file)
+        except OSError as e:
+            print(f"Error saving CSV file: {e}")
+            return False
+    finally:
+        temp_file.unlink(missing_ok=True)
+    return True
+
+
+def main():
+    # settings added after a conf.py was written fall back to being off
+    cache_dir = getattr(conf, 'EXTRACTION_CACHE_DIR', None)
+    scale_stats_path = getattr(conf, 'LINE_SCALE_STATS_PATH', None)
+    field_cache_path = getattr(conf, 'DERIVED_FIELDS_CACHE_PATH', None)
+    cache = ExtractionCache(cache_dir) if cache_dir else None
+    scale_stats = LineScaleStats(scale_stats_path) if scale_stats_path else None
+    field_cache = DerivedFieldsCache(field_cache_path) if field_cache_path else None
+    extraction_kwargs = dict(start_page=START_FROM_PAGE, workers=EXTRACTION_WORKERS, cache=cache,
+                             scale_stats=scale_stats,
+                             backend=getattr(conf, 'RASTER_BACKEND', DEFAULT_RASTER_BACKEND),
+                             engine=getattr(conf, 'TABLE_ENGINE', LATTICE_ENGINE),
+                             speculative_scales=getattr(conf, 'SPECULATIVE_SCALES', False))
+    previous_timetable = getattr(conf, 'PREVIOUS_TIMETABLE', None)
+    previous_scraped_output = getattr(conf, 'PREVIOUS_SCRAPED_OUTPUT', None)
+
+    output_file = octk.uniquify(conf.SCRAPED_TIMETABLE_OUTPUT_PATH)
+    # Create output directory
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    # Copy input timetable to output directory for reference
+    shutil.copy2(conf.INPUT_TIMETABLE, output_file.parent / Path(conf.INPUT_TIMETABLE).name)
+
+    if previous_timetable and previous_scraped_output:
+        calendar_views, reused_events = incremental.get_weekly_calendar_views_incrementally(
+            previous_timetable, previous_scraped_output, conf.INPUT_TIMETABLE,
+            ignore_pages=IGNORE_PAGES, **extraction_kwargs)
+        event_chunks = [post_process_calendar_views(calendar_views, field_cache, reused_events)]
+    elif STREAM_OUTPUT:
+        # each week is post-processed and written as soon as its page is extracted
+        calendar_views = extract.iter_weekly_calendar_views(
+            conf.INPUT_TIMETABLE, ignore_pages=IGNORE_PAGES, **extraction_kwargs)
+        event_chunks = post_processing.iter_post_processed_events(
+            process_timetable.iter_week_events(calendar_views), field_cache)
+    else:
+        calendar_views: list[structs.CalendarWeekView] = extract.get_weekly_calendar_views(
+            conf.INPUT_TIMETABLE, ignore_pages=IGNORE_PAGES, **extraction_kwargs)
+        event_chunks = [post_process_calendar_views(calendar_views, field_cache)]
+
+    # Save scraped timetable to CSV (when streaming, this is also where weeks are extracted and post-processed)
+    if not write_scraped_timetable(event_chunks, output_file):
+        return
+    print(f"Scraped timetable saved to: {output_file}")
+    if field_cache is not None:
+        field_cache.save()
 
-# write README.txt file to output directory
-readme_string = f"""# MD timetables
+
+    # write README.txt file to output directory
+    readme_string = f"""# MD timetables
 This folder contains timetable information scraped from the MD calendar presented in different formats.
 
 ## Importable Calendars
@@ -115,30 +191,10 @@ Enjoy!
 
 Source code: https://github.com/oakla/md-timetable-extract"""
 
-with open(output_file.parent / "README.txt", 'w') as f:
-    f.write(readme_string)
-
-
-    
-
-# TODO: address or suppress error message after running the script:
-"""
-Exception ignored in atexit callback <function rmtree at 0x0000029B82D918A0>:
-Traceback (most recent call last):
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 790, in rmtree
-    return _rmtree_unsafe(path, onexc)
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 629, in _rmtree_unsafe
-    onexc(os.unlink, fullname, err)
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 625, in _rmtree_unsafe
-    os.unlink(fullname)
-PermissionError: [WinError 32] The process cannot access the file because it is being used by another process: '%LOCALAPPDATA%\\Temp\\tmp6bj6p8yj\\page-11.pdf'
-Exception ignored in atexit callback <function rmtree at 0x0000029B82D918A0>:
-Traceback (most recent call last):
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 790, in rmtree
-    return _rmtree_unsafe(path, onexc)
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 629, in _rmtree_unsafe
-    onexc(os.unlink, fullname, err)
-  File "%PYENV_DIR%\pyenv-win\versions\3.13.1\Lib\shutil.py", line 625, in _rmtree_unsafe
-    os.unlink(fullname)
-PermissionError: [WinError 32] The process cannot access the file because it is being used by another process: '%LOCALAPPDATA%\\Temp\\tmph0n7uzmg\\page-10.pdf'
-"""
+    with open(output_file.parent / "README.txt", 'w') as f:
+        f.write(readme_string)
+
+
+# process pool workers re-import this module, so only run when executed directly
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from md_timetable_extract.description import ParsedDescription, normalise_whitespace, parse_description
+
+
+def test_parse_description_without_brackets():
+    assert parse_description("Self directed revision") == ParsedDescription(
+        "Self directed revision", prefix="Self directed revision")
+
+
+def test_parse_description_segments_in_order():
+    text = "Anatomy - Bones of the hand (Angus Cook) [Ross LT] (Recorded) [Lab]"
+    assert parse_description(text) == ParsedDescription(
+        text,
+        prefix="Anatomy - Bones of the hand ",
+        bracketed=("Ross LT", "Lab"),
+        parenthesised=("Angus Cook", "Recorded"),
+    )
+
+
+def test_parse_description_group_ranges():
+    text = "Physiology Lab Groups 1 - 10 [PHSL G11] group 11"
+    assert parse_description(text) == ParsedDescription(
+        text,
+        prefix="Physiology Lab Groups 1 - 10 ",
+        bracketed=("PHSL G11",),
+        group_ranges=("1 - 10", "11"),
+    )
+
+
+def test_parse_description_nested_and_unclosed_segments():
+    # segments nested in others are found too, and an unclosed bracket still ends the prefix
+    text = "Pathology - Shock [Path Museum (Level 2)] (unclosed"
+    assert parse_description(text) == ParsedDescription(
+        text,
+        prefix="Pathology - Shock ",
+        bracketed=("Path Museum (Level 2)",),
+        parenthesised=("Level 2",),
+    )
+
+
+def test_normalise_whitespace():
+    assert normalise_whitespace("Physiology -\nHeart\t (DP)") == "Physiology - Heart (DP)"
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from md_timetable_extract import process_timetable, structs
+
+MONDAY = 'Monday, 02 March 2026'
+TUESDAY = 'Tuesday, 03 March 2026'
+# a second Tuesday column, renamed as duplicate date columns are
+TUESDAY_2 = 'Tuesday, 03 March 2026(1)'
+
+ANATOMY = 'Anatomy - Bones (AC) [Ross LT]'
+LAB_1 = 'Lab Group 1-5 [PHSL G11]'
+LAB_2 = 'Lab Group 6-10 [PHSL G11]'
+ONLINE = 'Physiology -\nHeart (DP)'
+
+# Anatomy is on twice on Monday, with a free row in between
+WEEK_VIEW = pd.DataFrame({
+    'Time': ['08:00', '08:30', '09:00', '09:30', 'Online'],
+    MONDAY: [ANATOMY, ANATOMY, '', ANATOMY, ONLINE],
+    TUESDAY: ['', LAB_1, LAB_1, LAB_1, ''],
+    TUESDAY_2: ['', LAB_2, '', '', ''],
+})
+
+
+def event_records(events) -> list[dict]:
+    df = events.to_frame().astype(object)
+    return df.where(df.notna(), None).to_dict('records')
+
+
+def event(date: str, description: str, start_time: int | None, end_time: int | None,
+          location: str = "", session_type: str = "") -> dict:
+    day = pd.Timestamp(date).day_name()
+    return {'week': 3, 'day': day, 'date': date, 'description': description, 'start_time': start_time,
+            'end_time': end_time, 'location': location, 'session_type': session_type, 'subject': ""}
+
+
+def test_process_week_days_from_cell_text():
+    # cells with the same text in a column are one event, from their first row to their last
+    assert event_records(process_timetable.process_week_days(3, WEEK_VIEW)) == [
+        event('2026-03-02', ANATOMY, 8 * 60, 10 * 60),
+        event('2026-03-02', 'Physiology - Heart (DP)', None, None, location="Online", session_type="Lecture"),
+        event('2026-03-03', LAB_1, 8 * 60 + 30, 10 * 60),
+        event('2026-03-03', LAB_2, 8 * 60 + 30, 9 * 60),
+    ]
+
+
+def test_process_week_days_from_event_slots():
+    event_slots = [
+        structs.EventSlot(MONDAY, ANATOMY, 8 * 60, 8 * 60 + 30),
+        structs.EventSlot(MONDAY, ANATOMY, 9 * 60 + 30, 9 * 60 + 30),
+        structs.EventSlot(MONDAY, ONLINE, None, None),
+        structs.EventSlot(TUESDAY, LAB_1, 8 * 60 + 30, 9 * 60 + 30),
+        structs.EventSlot(TUESDAY_2, LAB_2, 8 * 60 + 30, 8 * 60 + 30),
+        # runs from the last timed row into the online rows
+        structs.EventSlot(TUESDAY_2, 'Revision', 9 * 60 + 30, None),
+    ]
+    assert event_records(process_timetable.process_week_days(3, WEEK_VIEW, event_slots)) == [
+        event('2026-03-02', ANATOMY, 8 * 60, 9 * 60),
+        event('2026-03-02', ANATOMY, 9 * 60 + 30, 10 * 60),
+        event('2026-03-02', 'Physiology - Heart (DP)', None, None, location="Online", session_type="Lecture"),
+        event('2026-03-03', LAB_1, 8 * 60 + 30, 10 * 60),
+        event('2026-03-03', LAB_2, 8 * 60 + 30, 9 * 60),
+        event('2026-03-03', 'Revision', 9 * 60 + 30, 19 * 60),
+    ]
+
+
+def test_process_week_days_appends_to_events():
+    events = process_timetable.process_week_days(3, WEEK_VIEW)
+    assert process_timetable.process_week_days(3, WEEK_VIEW, events=events) is events
+    assert len(events) == 8
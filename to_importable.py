@@ -1,11 +1,13 @@
 # from ics import Calendar, Event
-from datetime import datetime
 import csv
-import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-from typing import Literal
+from typing import Callable, Literal
 # Predefined set of strings type
 TimetableField = Literal[
     'week', 'day', 'date', 'event', 'start_time', 'end_time', 
@@ -14,6 +16,8 @@ TimetableField = Literal[
 ]
 
 import md_timetable_extract.conf as conf
+from md_timetable_extract.description import normalise_whitespace
+from md_timetable_extract.post_processing import group_event_index, map_unique
 
 # Predefined set of strings
 WEEK = 'week'
@@ -48,169 +52,209 @@ SUBJECT_ABBREVIATIONS = {
     'Research': 'Res',
 }
 
-"Subject"
-"Start Date"
-"Start Time"
-"End Date"
-"End Time"
-"All Day Event"
-"Description"
-"Location"
-"Private"
-
-
-class EventRow:
-
-    def __init__(self, row:pd.Series, include_session_type:bool = True):
-
-        self.include_session_type = include_session_type
-
-        self.row = row
-
-        self.subject = self.scrape_subject()
-        self.session_type = row[SESSION_TYPE]
-
-        self.name = self.make_name(row)
-        self.start_date = self.start_date()
-        self.start_time = self.start_time()
-        self.end_date = self.end_date()
-        self.end_time = self.end_time()
-        self.all_day_event = not bool(self.start_time)  
-        self.location = row[LOCATION]
-        self.presenter = self.scrape_presenter()
-        self.description = self.scrape_description()
-
-        
-    def scrape_subject(self):
-        self.subject = self.row[SUBJECT]
-        if self.subject:
-            return self.subject
-        
-        match = re.search(r'(\w+):', self.row[DESCRIPTION])
-        if match:
-            return match.group(1)
-        else:
-            return None
-
-
-    def make_name(self, row:pd.Series):
-
-        acc = []
-        if self.include_session_type:
-            if row[SESSION_TYPE]:
-                acc.append(row[SESSION_TYPE])
-            if row[SUBJECT]:
-                acc.append(SUBJECT_ABBREVIATIONS[row[SUBJECT]] if row[SUBJECT] in SUBJECT_ABBREVIATIONS else row[SUBJECT])
-            if row[TOPIC]:
-                acc.append(row[TOPIC])
-        else:
-            if row[SUBJECT]:
-                acc.append(SUBJECT_ABBREVIATIONS[row[SUBJECT]] if row[SUBJECT] in SUBJECT_ABBREVIATIONS else row[SUBJECT])
-            if row[TOPIC]:
-                acc.append(row[TOPIC])
-
-        if not acc:
-            return row[DESCRIPTION]
-        name = '-'.join(acc)
-
-        # if len(name) > 100:
-        #     name = name[:97] + '...'
-
-        return name
-
-    def __str__(self):
-        return f'{self.name} - {self.start_date} {self.start_time} - {self.end_time} - {self.location} - {self.presenter} - {self.description}'
-
-
-    def scrape_presenter(self):
-        if self.row[PRESENTER]:
-            return self.row[PRESENTER]
-        # find two letters betwen paranthesis
-        match = re.search(r'\((\w{2})\)', self.row[DESCRIPTION])
-        if match:
-            return match.group(1)
-        else:
-            return None
-    
-    def scrape_description(self):
-        event_text = self.row[DESCRIPTION]
-        # remove newline characters and double spaces
-        event_text = re.sub(r'\s+', ' ', event_text)
-        # match = re.search(r'\w+:\s?(.+)', event_text)
-        # if match:
-        #     return match.group(1).strip()
-        # else:
-        #     return event_text.strip()
-        return event_text.strip()
-        
-
-    def start_date(self, format='csv'):
-        return self.format_date(self.row[DATE], format)
-    
-    def end_date(self, format='csv'):
-        return self.format_date(self.row[DATE], format)
-    
+IMPORTABLE_CSV_FIELDS = [
+    "Subject",
+    "Start Date",
+    "Start Time",
+    "End Date",
+    "End Time",
+    "All Day Event",
+    "Description",
+    "Location",
+    "Private",
+]
+# rows converted (and written) at a time
+CSV_CHUNK_ROWS = 10_000
+# most calendar files written at once
+WRITER_THREADS = 4
+# 'HH:MM', as the scraper writes times
+TIME_PATTERN = r'^\s*(\d{1,2}):(\d{2})\s*$'
+
+
+def format_dates(dates: pd.Series, format='csv') -> pd.Series:
+    """Formats a column of dates for an importable CSV (or, with another `format`, as
+    ICS timestamps). Dates are parsed together as YYYY-MM-DD (as the scraper writes
+    them), and only the ones that aren't are parsed one by one. Blank or unparseable
+    dates are left blank."""
+    parsed = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+    others = parsed.isna() & (dates != '')
+    if others.any():
+        parsed[others] = map_unique(dates[others], lambda x: pd.to_datetime(x, errors='coerce'))
+    date_format = '%m/%d/%Y' if format == 'csv' else '%Y%m%dT%H%M%S'
+    return parsed.dt.strftime(date_format).fillna('')
+
+
+def format_times(times: pd.Series, format='csv') -> pd.Series:
+    """Formats a column of times like `format_dates` does dates. 'HH:MM' times (as the scraper writes
+    them) are read with one regex over the column, and only other times are parsed one
+    by one. Blank or unparseable times are left blank."""
+    times = times.astype(str)
+    parts = times.str.extract(TIME_PATTERN).astype('float64')
+    hours, minutes = parts[0], parts[1]
+    others = (hours.isna() | (hours >= 24) | (minutes >= 60)) & (times != '')
+    if others.any():
+        parsed = pd.to_datetime(map_unique(times[others], lambda x: pd.to_datetime(x, errors='coerce')))
+        hours[others] = parsed.dt.hour
+        minutes[others] = parsed.dt.minute
+    is_valid = hours.notna() & minutes.notna() & (hours < 24) & (minutes < 60)
+    hours = hours.where(is_valid, 0).astype(int)
+    minutes = minutes.where(is_valid, 0).astype(int).astype(str).str.zfill(2)
+    if format == 'csv':
+        twelve_hours = ((hours + 11) % 12 + 1).astype(str).str.zfill(2)
+        formatted = twelve_hours + ':' + minutes + ' ' + np.where(hours < 12, 'AM', 'PM')
+    else:
+        formatted = hours.astype(str).str.zfill(2) + minutes + '00'
+    return formatted.where(is_valid, '')
+
+
+def make_names(df: pd.DataFrame, include_session_type: bool = True) -> pd.Series:
+    """Event names for an importable CSV: the non-blank of session type (if
+    `include_session_type`), abbreviated subject and topic joined with '-', or the
+    description if they're all blank."""
+    subjects = df[SUBJECT].astype(str)
+    parts = [subjects.map(lambda x: SUBJECT_ABBREVIATIONS.get(x, x)), df[TOPIC].astype(str)]
+    if include_session_type:
+        parts.insert(0, df[SESSION_TYPE].astype(str))
+    names = pd.Series('', index=df.index, dtype=object)
+    for part in parts:
+        is_first = names == ''
+        names = names.mask(part != '', part.where(is_first, names + '-' + part))
+    return names.mask(names == '', df[DESCRIPTION])
+
+
+def importable_fields(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The `IMPORTABLE_CSV_FIELDS` of each row, except 'Subject', which depends on the
+    naming variant (see `make_names`)."""
+    start_dates = format_dates(df[DATE].astype(str))
+    start_times = format_times(df[START_TIME])
+    return {
+        'Start Date': start_dates,
+        'Start Time': start_times,
+        'End Date': start_dates,
+        'End Time': format_times(df[END_TIME]),
+        'All Day Event': start_times == '',
+        'Description': df[DESCRIPTION].astype(str).map(normalise_whitespace).str.strip(),
+        'Location': df[LOCATION],
+        'Private': pd.Series(False, index=df.index),
+    }
+
+
+@dataclass
+class CalendarOutput:
+    """An importable calendar for `write_importable_calendars`: the events `include`
+    selects (a boolean mask over the rows it's given, or every event if None), named
+    with or without their session type."""
+    path: Path
+    include: Callable[[pd.DataFrame], pd.Series] | None = None
+    include_session_type: bool = True
+
+
+def is_mandatory(df: pd.DataFrame) -> pd.Series:
+    return df['is_mandatory'] == 1
+
+
+def is_non_mandatory(df: pd.DataFrame) -> pd.Series:
+    return df['is_mandatory'] == 0
+
+
+def subject_is(subject: str) -> Callable[[pd.DataFrame], pd.Series]:
+    """A `CalendarOutput.include` for the events of one subject."""
+    return lambda df: df[SUBJECT] == subject
+
+
+def rows_in(positions: np.ndarray) -> Callable[[pd.DataFrame], np.ndarray]:
+    """A `CalendarOutput.include` for the events at `positions` (sorted row positions in
+    the table given to `write_importable_calendars`)."""
+    def include(df: pd.DataFrame) -> np.ndarray:
+        # chunks are labelled with their row positions
+        first = df.index[0]
+        start, end = np.searchsorted(positions, [first, first + len(df)])
+        mask = np.zeros(len(df), dtype=bool)
+        mask[positions[start:end] - first] = True
+        return mask
+    return include
+
+
+def all_of(*includes: Callable[[pd.DataFrame], pd.Series]) -> Callable[[pd.DataFrame], np.ndarray]:
+    """A `CalendarOutput.include` for the events every one of `includes` selects."""
+    return lambda df: np.logical_and.reduce([np.asarray(include(df), dtype=bool) for include in includes])
+
+
+def group_calendar_outputs(df: pd.DataFrame) -> list[CalendarOutput]:
+    """
+    Mandatory and non-mandatory calendars (at `conf.importable_calendar_path_for_group`)
+    for every group in the 'groups_list' column, to be written in the same pass as any other calendars.
+    A group's calendars have its own events and the events with no groups. Rows are looked up
+    in an index of the groups built once, instead of filtering the table for each group.
+    """
+    group_rows, shared_rows = group_event_index(df)
+    outputs = []
+    for group, rows in group_rows.items():
+        in_group = rows_in(np.union1d(rows, shared_rows))
+        outputs.append(CalendarOutput(conf.importable_calendar_path_for_group(group, mandatory=True),
+                                      all_of(in_group, is_mandatory), include_session_type=True))
+        outputs.append(CalendarOutput(conf.importable_calendar_path_for_group(group, mandatory=False),
+                                      all_of(in_group, is_non_mandatory), include_session_type=False))
+    return outputs
+
+
+def write_importable_calendars(df: pd.DataFrame, outputs: list[CalendarOutput]) -> list[int]:
+    """
+    Writes every calendar in `outputs` with one pass over the events.
+    Each chunk of `CSV_CHUNK_ROWS` rows is formatted once (names once per naming variant)
+    and its rows routed to the calendars that include them. Each chunk is written to
+    the calendar files by a pool of at most `WRITER_THREADS` threads, and must be written
+    before the next is formatted, so a failed write stops the pass.
+    Chunks keep the labels of their rows, which are their row positions in `df`.
+    Returns the number of events written to each calendar.
+    """
+    if df.empty:
+        raise ValueError("DataFrame is empty. Cannot convert to calendar importable CSV.")
+    df = df.fillna('').reset_index(drop=True)  # Convert NaN to empty string
+    variants = {output.include_session_type for output in outputs}
+    counts = [0] * len(outputs)
+
+    with ExitStack() as stack:
+        writers = [csv.writer(stack.enter_context(open(output.path, 'w', newline=''))) for output in outputs]
+        # entered after the files, so writes finish before any file is closed
+        pool = stack.enter_context(ThreadPoolExecutor(max_workers=min(WRITER_THREADS, len(outputs))))
+        _write_all(pool, [(writer.writerow, IMPORTABLE_CSV_FIELDS) for writer in writers])
+        for start in range(0, len(df), CSV_CHUNK_ROWS):
+            chunk = df.iloc[start:start + CSV_CHUNK_ROWS]
+            fields = importable_fields(chunk)
+            # each variant's rows as tuples, which the calendars pick theirs from
+            variant_rows = {}
+            for variant in variants:
+                columns = {'Subject': make_names(chunk, variant), **fields}
+                variant_rows[variant] = list(zip(*(columns[name].tolist() for name in IMPORTABLE_CSV_FIELDS)))
+            writes = []
+            for i, output in enumerate(outputs):
+                rows = variant_rows[output.include_session_type]
+                if output.include is not None:
+                    rows = [rows[j] for j in np.flatnonzero(np.asarray(output.include(chunk), dtype=bool))]
+                counts[i] += len(rows)
+                writes.append((writers[i].writerows, rows))
+            _write_all(pool, writes)
+
+    for output, count in zip(outputs, counts):
+        if not count:
+            print(f"Warning: no events for {output.path}")
+    return counts
+
+
+def _write_all(pool: ThreadPoolExecutor, writes: list[tuple[Callable, object]]):
+    """Runs each (write, rows) on the pool, one per file, and waits for them all,
+    raising the first error."""
+    for future in [pool.submit(write, rows) for write, rows in writes]:
+        future.result()
 
-    def format_date(self, date:str, format='csv'):
-        date = pd.to_datetime(date, errors='coerce')
-        if format == 'csv':
-            return date.strftime('%m/%d/%Y')
-        elif format == 'ical':
-            return date.strftime('%Y%m%dT%H%M%S')
-        return date
-    
-    def start_time(self, format='csv'):
-        return self.format_time(self.row[START_TIME], format)
-    
-    def end_time(self, format='csv'):
-        return self.format_time(self.row[END_TIME], format)
-
-    def format_time(self, time:str, format='csv'):
-        time_value = pd.to_datetime(time, errors='coerce')
-        if pd.isna(time_value):
-            return ''
-        time = time_value.time()
-        if isinstance(time, str):
-            time = datetime.strptime(time, '%H:%M').time().strftime('%I:%M %p')
-        if format == 'csv':
-            return time.strftime('%I:%M %p')
-        elif format == 'ical':
-            return time.strftime('%H%M%S')
-        return time
-
-
-    def to_csv_dict(self):
-        return {
-            'Subject': self.name,
-            'Start Date': self.start_date,
-            'Start Time': self.start_time,
-            'End Date': self.end_date,
-            'End Time': self.end_time,
-            'All Day Event': self.all_day_event,
-            'Description': self.description,
-            'Location': self.location,
-            'Private': False
-        }
-    
 
 def df_to_calendar_importable_csv(df: pd.DataFrame, output_file: str, include_session_type: bool = True):
     """
     Converts a DataFrame to a calendar importable CSV format.
+    See `write_importable_calendars` to write more than one calendar from the same events.
     """
-    if df.empty:
-        raise ValueError("DataFrame is empty. Cannot convert to calendar importable CSV.")
-    df = df.fillna('')  # Convert NaN to empty string
-    new_csv_rows = []
-    
-    for i, row in df.iterrows():
-        event = EventRow(row, include_session_type=include_session_type)
-        new_csv_rows.append(event.to_csv_dict())
-
-    with open(output_file, 'w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=new_csv_rows[0].keys())
-        writer.writeheader()
-        for row in new_csv_rows:
-            writer.writerow(row)
+    write_importable_calendars(df, [CalendarOutput(Path(output_file), include_session_type=include_session_type)])
 
 
 def drop_groups(df: pd.DataFrame, groups: list[str]) -> pd.DataFrame:
@@ -236,9 +280,7 @@ elif input_file.suffix in ['.xlsx', '.xls']:
 # convert nan to empty string
 df = df.fillna('')
 
-df_non_mandatory = df[df['is_mandatory'] == 0]
-assert not df_non_mandatory.empty, "No non-mandatory events found in the input file."
-df_mandatory = df[df['is_mandatory'] == 1]
+assert is_non_mandatory(df).any(), "No non-mandatory events found in the input file."
 
 # output_files = {
 #     'non_mandatory': conf.importable_calendar_path_for_group('all', mandatory=False]
@@ -247,7 +289,12 @@ df_mandatory = df[df['is_mandatory'] == 1]
 #     input(f"Warning: Overwriting existing file {conf.IMPORTABLE_CALENDAR_FILE}\n Press Enter to continue...")
 output_dir = Path(conf.IMPORTABLE_CALENDAR_FILE).parent
 output_dir.mkdir(parents=True, exist_ok=True)
-df_to_calendar_importable_csv(df_non_mandatory, Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(non_mandatory).csv'), include_session_type=False)
-df_to_calendar_importable_csv(df_mandatory, Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(mandatory).csv'), include_session_type=True)
-df_to_calendar_importable_csv(df, Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(all).csv'), include_session_type=True)
-
+# add a calendar here (e.g. CalendarOutput(path, subject_is('Anatomy'))) and it's written in the same pass
+outputs = [
+    CalendarOutput(Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(non_mandatory).csv'), is_non_mandatory, include_session_type=False),
+    CalendarOutput(Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(mandatory).csv'), is_mandatory, include_session_type=True),
+    CalendarOutput(Path(output_dir, f'{conf.IMPORTABLE_CALENDAR_FILE}(all).csv'), include_session_type=True),
+]
+if getattr(conf, 'IMPORTABLE_GROUP_CALENDARS', False):
+    outputs += group_calendar_outputs(df)
+write_importable_calendars(df, outputs)